@@ -1,54 +1,274 @@
-import pygame
+import bisect
+import math
+import mmap
+import os
+import queue
 import random
+import struct
+import sys
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+
+import numpy as np
+import pygame
+
+# argparse, hashlib, json, multiprocessing and concurrent.futures are imported
+# where they are used: together they took longer to import than everything else
+# here, and a plain game launch needs none of them before the first frame
 
 
 
 # =========================
 # ASSET LOADING
 # =========================
+
+ASSET_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSET_CACHE_DIR = os.path.join(ASSET_DIR, ".asset_cache")
+
+# name -> (file, size in game, fallback colour if the file can't be loaded)
+SPRITES = {
+    "player": ("player.png", (32, 48), (255, 100, 100)),
+    "background": ("background.png", (800, 600), (135, 206, 235)),  # Sky blue
+    "icicle": ("icicle.png", (20, 40), (200, 230, 255)),
+    "rock": ("icicle.png", (30, 30), (120, 110, 100)),  # no art of its own yet, drawn at its hitbox size
+    "avalanche": ("avalanche.png", (800, 100), (255, 255, 255)),
+    "penguin": ("penguin.png", (32, 32), (40, 40, 60)),
+    "candycane": ("candycane.png", (32, 32), (220, 40, 40)),
+}
+# Sprites packed together into one texture, background is big and opaque so it stays on its own
+ATLAS_SPRITES = ("player", "icicle", "rock", "avalanche", "penguin", "candycane")
+
+
 def load_sprite(path, scale=None):
     # handles sprite loading
     try:
-        sprite = pygame.image.load(path).convert_alpha()
+        sprite = pygame.image.load(path)
+        if pygame.display.get_surface():
+            sprite = sprite.convert_alpha()
         if scale:
             sprite = pygame.transform.scale(sprite, scale)
         return sprite
-    except:
+    except (pygame.error, OSError):
         # Fallback colored rectangle if sprite not found
         print(f"Warning: Could not load {path}")
-        surface = pygame.Surface((32, 48))
+        surface = pygame.Surface(scale or (32, 48))
         surface.fill((255, 100, 100))
         return surface
 
-try:
-    # Player sprite
-    playersp = load_sprite("player.png", (32, 48))
 
-    # Background
-    background = load_sprite("background.png", (800, 600))
-    
-    # Hazard sprites
-    icicle_sprite = load_sprite("icicle.png", (20, 40))
-    avalanche_sprite = load_sprite("avalanche.png", (800, 100))
-    
-    # Platform sprites
-    #ice_platform = load_sprite("ice_platform.png", (100, 20))
-    #rock_platform = load_sprite("rock_platform.png", (100, 20))
-    
-except:
-    # Fallback colors if sprites not found
-    playersp = pygame.Surface((32, 48))
+# channel masks of a surface made from "BGRA" bytes, what the disk cache stores
+BGRA_MASKS = pygame.image.frombuffer(bytearray(4), (1, 1), "BGRA").get_masks()
 
-    
-    background = pygame.Surface((800, 600))
-    background.fill((135, 206, 235))  # Sky blue
-    
-    icicle_sprite = pygame.Surface((20, 40))
-    icicle_sprite.fill((200, 230, 255))
 
-    avalanche_sprite = pygame.Surface((800, 100))
-    avalanche_sprite.fill((255, 255, 255))
-    
+def bgra_pixels(surface):
+    # pixels as "BGRA" bytes, the surface's own memory when it is already laid out that way
+    if surface.get_masks() == BGRA_MASKS and surface.get_pitch() == surface.get_width() * 4:
+        return surface.get_buffer()
+    return pygame.image.tobytes(surface, "BGRA")
+
+
+def pack_shelves(sizes, max_width=1024, padding=1):
+    # Simple shelf packer: tallest first, fill rows left to right.
+    # sizes: {name: (w, h)} -> ({name: (x, y)}, (atlas_w, atlas_h))
+    positions = {}
+    x = y = shelf_h = 0
+    width = 0
+    for name in sorted(sizes, key=lambda n: (-sizes[n][1], n)):
+        w, h = sizes[name]
+        if x and x + w > max_width:
+            y += shelf_h + padding
+            x = shelf_h = 0
+        positions[name] = (x, y)
+        x += w + padding
+        shelf_h = max(shelf_h, h)
+        width = max(width, x - padding)
+    return positions, (width, y + shelf_h)
+
+
+class AssetManager:
+    # Loads sprites on first use instead of at import time.
+    # - the small sprites share one atlas texture (they are subsurfaces of it),
+    #   laid out from the sizes in SPRITES so no PNG is needed to place them
+    # - once there is a display, each texture (the atlas, and every sprite not in
+    #   it) is cached on disk as its final scaled and converted pixels, keyed by
+    #   the PNGs' hash and the sizes. Later launches read that straight into a
+    #   surface, nothing gets decoded, scaled or converted
+    # - preload() decodes whatever isn't cached yet in a thread pool
+    # - surfaces are converted to the display format once there is a display,
+    #   anything loaded before set_mode gets converted on the next get()
+    # - collision masks are built once per sprite and size and shared by
+    #   everything drawn with that sprite
+
+    def __init__(self, asset_dir=ASSET_DIR, cache_dir=ASSET_CACHE_DIR, sprites=SPRITES,
+                 atlas_sprites=ATLAS_SPRITES):
+        self.asset_dir = asset_dir
+        self.cache_dir = cache_dir
+        self.sprites = sprites
+        self.atlas_sprites = atlas_sprites
+        self.surfaces = {}
+        self.atlas = None
+        self.atlas_rects = {}
+        self.converted = False
+        self.masks = {}  # (name, size) -> pygame.mask.Mask
+
+    def get(self, name):
+        self._check_display()
+        surface = self.surfaces.get(name)
+        if surface is None:
+            if name in self.atlas_sprites:
+                self._build_atlas()
+            else:
+                self.surfaces[name] = self._texture(name, (name,))
+            surface = self.surfaces[name]
+        return surface
+
+    def mask(self, name):
+        """Mask of the sprite's opaque pixels, for pixel-accurate collisions"""
+        key = (name, self.sprites[name][1])
+        mask = self.masks.get(key)
+        if mask is None:
+            mask = self.masks[key] = pygame.mask.from_surface(self.get(name))
+        return mask
+
+    def preload(self, names=None, workers=4):
+        """Get sprites ready ahead of time, decoding the ones that aren't cached in a thread pool"""
+        self._check_display()
+        names = [n for n in names or self.sprites if n not in self.surfaces]
+        textures = {n: (n,) for n in names if n not in self.atlas_sprites}
+        if self.atlas is None and any(n in self.atlas_sprites for n in names):
+            textures["atlas"] = self.atlas_sprites
+        decode = [n for label, members in textures.items()
+                  if not os.path.exists(self._cache_path(label, members) or "") for n in members]
+        pixels = {}
+        if decode:
+            from concurrent.futures import ThreadPoolExecutor
+
+            with ThreadPoolExecutor(max_workers=workers) as pool:
+                pixels = dict(zip(decode, pool.map(self.load_pixels, decode)))
+        for label, members in textures.items():
+            if label == "atlas":
+                self._build_atlas(pixels)
+            else:
+                self.surfaces[label] = self._texture(label, members, pixels)
+
+    def load_pixels(self, name, convert=False):
+        """
+        Sprite decoded from its PNG and scaled to size.
+        convert=True also converts it to the display format (main thread only).
+        """
+        filename, size, fallback = self.sprites[name]
+        path = os.path.join(self.asset_dir, filename)
+        try:
+            surface = pygame.image.load(path)
+        except (pygame.error, OSError):
+            print(f"Warning: Could not load {path}")
+            surface = pygame.Surface(size, pygame.SRCALPHA)
+            surface.fill(fallback)
+            return surface
+        if convert:
+            # convert while it is still small, the scaled copy keeps the format
+            surface = self._finish(surface)
+        return pygame.transform.scale(surface, size)
+
+    def _texture(self, label, members, pixels=None):
+        """Final surface of one texture, read from the disk cache or built and then cached"""
+        path = self._cache_path(label, members)
+        surface = self._read_cache(path, self._texture_size(members)) if path else None
+        if surface is not None:
+            return surface
+        if label == "atlas":
+            surface = self._pack_atlas(pixels or {})
+        else:
+            surface = self._finish(pixels[label]) if pixels and label in pixels else \
+                self.load_pixels(label, convert=True)
+        if path:
+            self._write_cache(path, surface)
+        return surface
+
+    def _texture_size(self, members):
+        if len(members) == 1:
+            return self.sprites[members[0]][1]
+        return pack_shelves({n: self.sprites[n][1] for n in members})[1]
+
+    def _cache_path(self, label, members):
+        # None until there is a display (the cache holds converted pixels) or if a PNG is missing
+        display = pygame.display.get_surface()
+        if display is None or display.get_masks()[:3] != BGRA_MASKS[:3]:
+            return None
+        crc = 0
+        for name in members:
+            filename, size, _ = self.sprites[name]
+            try:
+                with open(os.path.join(self.asset_dir, filename), "rb") as f:
+                    crc = zlib.crc32(f.read(), zlib.crc32(f"{filename}:{size}".encode(), crc))
+            except OSError:
+                return None
+        w, h = self._texture_size(members)
+        return os.path.join(self.cache_dir, f"{label}-{crc:08x}-{w}x{h}.bgra")
+
+    def _read_cache(self, path, size):
+        try:
+            with open(path, "rb") as f:
+                data = bytearray(size[0] * size[1] * 4)
+                if f.readinto(data) != len(data):
+                    return None
+        except OSError:
+            return None
+        # the surface uses the bytes as they are, no copy and no conversion
+        return pygame.image.frombuffer(data, size, "BGRA")
+
+    def _write_cache(self, path, surface):
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(bgra_pixels(surface))
+            os.replace(tmp, path)
+        except OSError:
+            pass  # read-only install, just decode again next time
+
+    def _finish(self, surface):
+        if pygame.display.get_surface():
+            return surface.convert_alpha()
+        return surface
+
+    def _build_atlas(self, pixels=None):
+        sizes = {n: self.sprites[n][1] for n in self.atlas_sprites}
+        positions, _ = pack_shelves(sizes)
+        self.atlas_rects = {n: pygame.Rect(positions[n], sizes[n]) for n in sizes}
+        self._set_atlas(self._texture("atlas", self.atlas_sprites, pixels))
+
+    def _pack_atlas(self, pixels):
+        members = {n: self._finish(pixels[n]) if n in pixels else self.load_pixels(n, convert=True)
+                   for n in self.atlas_sprites}
+        positions, atlas_size = pack_shelves({n: s.get_size() for n, s in members.items()})
+        atlas = pygame.Surface(atlas_size, pygame.SRCALPHA)
+        for name, surface in members.items():
+            # straight copy of the pixels, no blending
+            atlas.blit(surface, positions[name], special_flags=pygame.BLEND_RGBA_MAX)
+        return self._finish(atlas)
+
+    def _set_atlas(self, atlas):
+        self.atlas = atlas
+        for name, rect in self.atlas_rects.items():
+            self.surfaces[name] = atlas.subsurface(rect)
+
+    def _check_display(self):
+        if not self.converted and pygame.display.get_surface():
+            self._convert_all()
+
+    def _convert_all(self):
+        self.converted = True
+        if self.atlas is not None:
+            self._set_atlas(self.atlas.convert_alpha())
+        for name, surface in list(self.surfaces.items()):
+            if name not in self.atlas_rects:
+                self.surfaces[name] = surface.convert_alpha()
+
+
+assets = AssetManager()
 
 
 # =========================
@@ -69,7 +289,7 @@ class Player:
     # animation states (climbing, walking, slipping)
     # sprite management
 
-    def __init__(self,playersp):
+    def __init__(self, playersp, events):
         # Physics
         self.position = pygame.math.Vector2(100, 540)
         self.velocity = pygame.math.Vector2(0, 0)
@@ -92,19 +312,24 @@ class Player:
         # Health
 
         self.health = 100
-        self.invinc_timer = 0
+        self.max_health = 100
+        self.events = events  # TimerWheel, ends invincibility
+        self.invinc_end = None
         self.invinc_dur = 0.5
 
+    @property
+    def invinc_timer(self):
+        return self.events.remaining(self.invinc_end)
+
     def damage(self, amount):
-        if self.invinc_timer <= 0:
+        if self.invinc_end is None:
             self.health -= amount
-            self.invinc_timer = self.invinc_dur
+            self.invinc_end = self.events.after(self.invinc_dur, self.end_invincibility)
             return True
         return False
-    
-    def update(self, dt):
-        if self.invinc_timer > 0:
-            self.invinc_timer -= dt
+
+    def end_invincibility(self):
+        self.invinc_end = None
 # =========================
 # GRAVITY SYSTEM
 # =========================
@@ -136,8 +361,11 @@ def setup_player_gravity(player):
     player.landing_speed_threshold = 350.0
     player.small_bounce_factor = 0.18      # 0 = no bounce, 0.2 = gentle hop
 
+    # What the player is standing on, kept up to date by move_swept
+    player.ground = None
 
-def apply_gravity(player, delta_time, jump_pressed=False, jump_held=False, wind_x=0.0):
+
+def apply_gravity(player, delta_time, jump_pressed=False, jump_held=False, wind_x=0.0, solids=None, walk_x=0.0):
     """
     Advanced gravity for a platformer.
 
@@ -147,6 +375,10 @@ def apply_gravity(player, delta_time, jump_pressed=False, jump_held=False, wind_
       and the fields created in setup_player_gravity()
 
     delta_time: frame time in seconds
+    solids: function rect -> platforms near it. When given, movement is
+      swept against them in substeps (see move_swept), so nothing tunnels
+      however fast the player falls or however long the frame was
+    walk_x: px/s of walking on top of velocity.x
     """
 
     dt = delta_time
@@ -196,16 +428,21 @@ def apply_gravity(player, delta_time, jump_pressed=False, jump_held=False, wind_
     if (not player.is_grounded) or player.is_sliding:
         player.acceleration.x += wind_x
 
-    # --- Integrate acceleration -> velocity ---
-    player.velocity.x += player.acceleration.x * dt
-    player.velocity.y += player.acceleration.y * dt
+    if solids is not None:
+        move_swept(player, dt, solids, walk_x)
+    else:
+        player.position.x += walk_x * dt
+
+        # --- Integrate acceleration -> velocity ---
+        player.velocity.x += player.acceleration.x * dt
+        player.velocity.y += player.acceleration.y * dt
 
-    # Clamp fall speed
-    if player.velocity.y > player.max_fall_speed:
-        player.velocity.y = player.max_fall_speed
+        # Clamp fall speed
+        if player.velocity.y > player.max_fall_speed:
+            player.velocity.y = player.max_fall_speed
 
-    # --- Integrate velocity -> position ---
-    player.position += player.velocity * dt
+        # --- Integrate velocity -> position ---
+        player.position += player.velocity * dt
 
     # Keep rect in sync
     if hasattr(player, "rect"):
@@ -226,26 +463,417 @@ def apply_gravity(player, delta_time, jump_pressed=False, jump_held=False, wind_
     player.was_grounded_last_frame = player.is_grounded
 
 
+SUBSTEP_PX = 8.0  # most the player moves per substep, about half the thinnest platform
+
+
+def sweep_box(x, y, w, h, dx, dy, rect):
+    """
+    Swept AABB: when the box (x, y, w, h) moving by (dx, dy) first touches
+    rect, as a fraction of the move, and which axis it hit on ("x" or "y").
+    None if it doesn't touch rect during the move.
+    """
+    if dx > 0:
+        entry_x = (rect.left - (x + w)) / dx
+        exit_x = (rect.right - x) / dx
+    elif dx < 0:
+        entry_x = (rect.right - x) / dx
+        exit_x = (rect.left - (x + w)) / dx
+    elif x + w <= rect.left or x >= rect.right:
+        return None
+    else:
+        entry_x, exit_x = -float("inf"), float("inf")
+
+    if dy > 0:
+        entry_y = (rect.top - (y + h)) / dy
+        exit_y = (rect.bottom - y) / dy
+    elif dy < 0:
+        entry_y = (rect.bottom - y) / dy
+        exit_y = (rect.top - (y + h)) / dy
+    elif y + h <= rect.top or y >= rect.bottom:
+        return None
+    else:
+        entry_y, exit_y = -float("inf"), float("inf")
+
+    entry = max(entry_x, entry_y)
+    if entry < 0 or entry >= 1 or entry >= min(exit_x, exit_y):
+        return None  # misses, too far away, or already inside (see push_out)
+    return entry, "x" if entry_x > entry_y else "y"
+
+
+def push_out(player, w, h, platforms):
+    # Anything already overlapping the player (a platform streamed in on top
+    # of them, the spawn point) pushes them out the shortest way, up on ties
+    pos = player.position
+    for p in platforms:
+        r = p.rect
+        if pos.x + w <= r.left or pos.x >= r.right or pos.y + h <= r.top or pos.y >= r.bottom:
+            continue
+        up = pos.y + h - r.top
+        down = r.bottom - pos.y
+        left = pos.x + w - r.left
+        right = r.right - pos.x
+        least = min(up, down, left, right)
+        if least == up:
+            pos.y = r.top - h
+        elif least == down:
+            pos.y = r.bottom
+        elif least == left:
+            pos.x = r.left - w
+        else:
+            pos.x = r.right
+
+
+def move_swept(player, dt, solids, walk_x=0.0):
+    """
+    Integrate velocity and position in as many substeps as the speed needs,
+    sweeping the player's box against nearby platforms each time.
+    Feet, head and sides are resolved separately: landing grounds the player
+    on player.ground, bumping the head or a side stops that axis only.
+    """
+    w, h = player.rect.size
+    pos = player.position
+    vel = player.velocity
+    acc = player.acceleration
+
+    # worst case speed over the step decides the substeps
+    fastest = max(abs(vel.x + walk_x) + abs(acc.x) * dt, min(abs(vel.y) + abs(acc.y) * dt, player.max_fall_speed))
+    substeps = max(1, math.ceil(fastest * dt / SUBSTEP_PX))
+    sub_dt = dt / substeps
+
+    # one broadphase query covering everywhere the player can get to this step
+    reach = fastest * dt + 1
+    nearby = solids(pygame.Rect(pos.x - reach, pos.y - reach, w + 2 * reach, h + 2 * reach))
+    push_out(player, w, h, nearby)
+
+    player.is_grounded = False
+    player.ground = None
+    for _ in range(substeps):
+        vel.x += acc.x * sub_dt
+        vel.y += acc.y * sub_dt
+        if vel.y > player.max_fall_speed:
+            vel.y = player.max_fall_speed
+
+        dx = (vel.x + walk_x) * sub_dt
+        dy = vel.y * sub_dt
+        # at most one hit per axis, then slide along what was hit
+        for _ in range(2):
+            if not (dx or dy):
+                break
+            first = None
+            for p in nearby:
+                hit = sweep_box(pos.x, pos.y, w, h, dx, dy, p.rect)
+                if hit is not None and (first is None or hit[0] < first[0]):
+                    first = (hit[0], hit[1], p)
+            if first is None:
+                pos.x += dx
+                pos.y += dy
+                break
+
+            t, axis, p = first
+            if axis == "y":
+                pos.x += dx * t
+                if dy > 0:  # feet
+                    pos.y = p.rect.top - h
+                    player.is_grounded = True
+                    player.ground = p
+                else:  # head
+                    pos.y = p.rect.bottom
+                vel.y = 0.0
+                dx *= 1 - t
+                dy = 0.0
+            else:  # sides
+                pos.y += dy * t
+                pos.x = p.rect.left - w if dx > 0 else p.rect.right
+                vel.x = 0.0
+                dx = 0.0
+                dy *= 1 - t
+
+
+# =========================
+# BROADPHASE
+# =========================
+
+class SpatialHash:
+    # Uniform grid broadphase for anything with a .rect
+    # Static things like platforms are inserted once, moving things call move()
+    # after each update and only get re-binned when they cross into a different cell.
+    # query() returns the nearby candidates, callers still do colliderect.
+
+    def __init__(self, cell_size=128):
+        self.cell_size = cell_size
+        self.cells = {}    # (cx, cy) -> {obj: insertion order}
+        self.entries = {}  # obj -> ((cx0, cy0, cx1, cy1), order)
+        self.next_order = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, obj):
+        return obj in self.entries
+
+    def _cell_range(self, rect):
+        cs = self.cell_size
+        x, y, w, h = rect
+        cx0 = x // cs
+        cy0 = y // cs
+        # zero-sized rects still sit in one cell
+        return (cx0, cy0,
+                (x + w - 1) // cs if w > 0 else cx0,
+                (y + h - 1) // cs if h > 0 else cy0)
+
+    def _bin(self, obj, cell_range, order):
+        cx0, cy0, cx1, cy1 = cell_range
+        cells = self.cells
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                cell = cells.get((cx, cy))
+                if cell is None:
+                    cell = cells[(cx, cy)] = {}
+                cell[obj] = order
+        self.entries[obj] = (cell_range, order)
+
+    def _unbin(self, obj, entry):
+        cx0, cy0, cx1, cy1 = entry[0]
+        cells = self.cells
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                cell = cells[(cx, cy)]
+                del cell[obj]
+                if not cell:
+                    del cells[(cx, cy)]
+
+    def insert(self, obj):
+        if obj in self.entries:
+            self.move(obj)
+            return
+        self._bin(obj, self._cell_range(obj.rect), self.next_order)
+        self.next_order += 1
+
+    def remove(self, obj):
+        entry = self.entries.pop(obj, None)
+        if entry is not None:
+            self._unbin(obj, entry)
+
+    def move(self, obj):
+        """Re-bin obj after its rect changed (cheap when it stays in the same cells)"""
+        entry = self.entries[obj]
+        cell_range = self._cell_range(obj.rect)
+        if cell_range != entry[0]:
+            self._unbin(obj, entry)
+            self._bin(obj, cell_range, entry[1])
+
+    def clear(self):
+        self.cells.clear()
+        self.entries.clear()
+
+    def query(self, rect):
+        """Everything sharing a cell with rect, in insertion order"""
+        cx0, cy0, cx1, cy1 = self._cell_range(rect)
+        cells = self.cells
+        if cx0 == cx1 and cy0 == cy1:
+            cell = cells.get((cx0, cy0))
+            if not cell:
+                return []
+            return sorted(cell, key=cell.get) if len(cell) > 1 else list(cell)
+
+        found = {}
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                cell = cells.get((cx, cy))
+                if cell:
+                    found.update(cell)
+        return sorted(found, key=found.get)
+
+
+# =========================
+# SCHEDULER
+# =========================
+
+class Timer:
+    # One pending event on a TimerWheel, keep it around to cancel it
+    __slots__ = ("due", "period", "callback", "args", "cancelled")
+
+    def __init__(self, due, period, callback, args):
+        self.due = due  # wheel tick it fires on
+        self.period = period  # ticks between repeats, 0 for one-shot
+        self.callback = callback
+        self.args = args
+        self.cancelled = False
+
+
+class TimerWheel:
+    # Hierarchical timing wheel counting in fixed simulation ticks.
+    # Level 0 has a slot per tick for the next 64 ticks, each level above
+    # covers 64x the span of the one below. A timer sits in the lowest level
+    # where its tick and the current tick agree on all higher digits, and is
+    # moved down a level (cascaded) when the wheel below wraps round to it.
+    # advance() only touches the one slot that's due, plus a cascade every
+    # 64 ticks, so thousands of pending timers cost nothing until they fire.
+    # Cancelled timers are just flagged and dropped when their slot comes up.
+
+    BITS = 6
+    LEVELS = 4  # 64 ** 4 ticks, about 77 hours at 60 Hz, later goes in overflow
+
+    def __init__(self, timestep=1 / 60):
+        self.timestep = timestep
+        self.now = 0
+        self.count = 0  # pending, not cancelled
+        self.version = 0  # moves on whenever a timer is added, fires, moves or is cancelled
+        self.wheels = [[[] for _ in range(1 << self.BITS)] for _ in range(self.LEVELS)]
+        self.overflow = []
+
+    def __len__(self):
+        return self.count
+
+    def ticks(self, seconds):
+        """Whole ticks in seconds, at least one so nothing fires on the tick it's scheduled"""
+        return max(1, round(seconds / self.timestep))
+
+    def after(self, seconds, callback, *args):
+        """Call callback(*args) once, seconds from now"""
+        return self._add(Timer(self.now + self.ticks(seconds), 0, callback, args))
+
+    def every(self, seconds, callback, *args, aligned=False):
+        """
+        Call callback(*args) every seconds from now until cancelled.
+        aligned timers fire on multiples of the period, so any with the same
+        period stay in step with each other whenever they were added.
+        """
+        period = self.ticks(seconds)
+        due = self.now + period
+        if aligned:
+            due -= due % period
+            if due <= self.now:
+                due += period
+        return self._add(Timer(due, period, callback, args))
+
+    def cancel(self, timer):
+        if timer is not None and not timer.cancelled:
+            timer.cancelled = True
+            self.count -= 1
+            self.version += 1
+
+    def remaining(self, timer):
+        """Seconds until timer fires, 0 once it has (or was cancelled)"""
+        if timer is None or timer.cancelled or timer.due <= self.now:
+            return 0.0
+        return (timer.due - self.now) * self.timestep
+
+    def _add(self, timer):
+        self.count += 1
+        self.version += 1
+        self._insert(timer)
+        return timer
+
+    def _insert(self, timer):
+        bits = self.BITS
+        due = timer.due
+        now = self.now
+        for level in range(self.LEVELS):
+            if due >> (bits * (level + 1)) == now >> (bits * (level + 1)):
+                self.wheels[level][(due >> (bits * level)) & ((1 << bits) - 1)].append(timer)
+                return
+        self.overflow.append(timer)
+
+    def advance(self):
+        """Move on one tick and fire everything due on it"""
+        self.now = now = self.now + 1
+        bits = self.BITS
+        mask = (1 << bits) - 1
+        # higher levels first, their timers might land in the slot below
+        if not now & mask:
+            level = 1  # ends up one past the highest level that just wrapped
+            while level <= self.LEVELS and not now & ((1 << (bits * level)) - 1):
+                level += 1
+            if level > self.LEVELS:
+                far, self.overflow = self.overflow, []
+                self._cascade(far)
+            for level in range(min(level, self.LEVELS) - 1, 0, -1):
+                slots = self.wheels[level]
+                index = (now >> (bits * level)) & mask
+                due, slots[index] = slots[index], []
+                self._cascade(due)
+
+        slots = self.wheels[0]
+        due, slots[now & mask] = slots[now & mask], []
+        if due:
+            self.version += 1
+        for timer in due:
+            if timer.cancelled:
+                continue
+            if timer.period:
+                timer.due += timer.period
+                self._insert(timer)
+            else:
+                timer.cancelled = True  # spent
+                self.count -= 1
+            timer.callback(*timer.args)
+
+    def _cascade(self, timers):
+        if timers:
+            self.version += 1
+        for timer in timers:
+            if not timer.cancelled:
+                self._insert(timer)
+
+    def snapshot(self):
+        """Where every timer sits right now, and its due tick, for restore()"""
+        placed = [(level, index, timer, timer.due, timer.cancelled)
+                  for level, slots in enumerate(self.wheels)
+                  for index, slot in enumerate(slots) if slot
+                  for timer in slot]
+        placed += [(-1, 0, timer, timer.due, timer.cancelled) for timer in self.overflow]
+        return self.count, placed
+
+    def restore(self, now, state):
+        """
+        Go back to tick now, with every timer where snapshot() found it.
+        Fine for any tick up to the next change after the snapshot, nothing moved until then.
+        """
+        self.now = now
+        self.count, placed = state
+        self.wheels = [[[] for _ in range(1 << self.BITS)] for _ in range(self.LEVELS)]
+        self.overflow = []
+        for level, index, timer, due, cancelled in placed:
+            timer.due = due
+            timer.cancelled = cancelled
+            (self.wheels[level][index] if level >= 0 else self.overflow).append(timer)
+        self.version += 1
+
+
 # =========================
 # EMPTY CLASSES (partner)
 # =========================
 
+# Per-surface data shared by every platform of that surface
+# name -> (slipperiness, color), anything unknown behaves like rock
+SURFACE_KINDS = {
+    "ice": (0.2, (100, 220, 255)),
+    "rock": (0.8, (100, 100, 100)),
+}
+
+
 class Platform:
     # Standard platforms
     # rect/collision shape
     # surface_type (ice, rock, snow)
     # slipperiness_factor
+    # Slotted, a streamed level can hold millions of these. Slip and color
+    # come from SURFACE_KINDS instead of being stored on every platform.
+
+    __slots__ = ("rect", "surface")
+
     def __init__(self,x,y,width,height,surface):
         self.rect = pygame.Rect(x,y,width,height)
         self.surface = surface
-        self.slip = 0
 
-        if surface == "ice":
-            self.slip = 0.2
-            self.color = (100, 220, 255)
-        else:
-            self.slip = 0.8
-            self.color = (100,100,100)
+    @property
+    def slip(self):
+        return SURFACE_KINDS.get(self.surface, SURFACE_KINDS["rock"])[0]
+
+    @property
+    def color(self):
+        return SURFACE_KINDS.get(self.surface, SURFACE_KINDS["rock"])[1]
 
     def draw(self, screen):
         # Draw the platform
@@ -256,30 +884,38 @@ class Hazard:
     # Falling icicles, avalanches, crevasses
     # activation_zone
     # damage_value
-    
-    def __init__(self,x,y,obst_type="icicle"):
+    # Slotted, damage, size and sprite come from HAZARD_KINDS. The game itself
+    # keeps its hazards in a HazardPool, this is the one-object-per-hazard form.
+
+    __slots__ = ("obst_type", "active", "fallsp", "rect", "prev_y")
+
+    def __init__(self,x,y,obst_type="icicle",rng=random):
         self.obst_type = obst_type
-        self.damage = 0
         self.active = True
-        
-        if self.obst_type == "icicle":
-            self.damage = 10
-            self.sprite = icicle_sprite
-            self.fallsp = random.randint(300,500)
-            self.rect = pygame.Rect(x, y, 20, 40)  # Add rect for collision
-        elif self.obst_type == "avalanche":
-            self.damage = 999
-            self.sprite = avalanche_sprite
+        _, _, width, height = self.kind
+
+        if self.obst_type == "avalanche":
             self.fallsp = 200
-            self.rect = pygame.Rect(x, y, 800, 100)  # Full width avalanche
         else:
-            self.damage = 15
-            self.sprite = icicle_sprite  # Fallback
-            self.fallsp = random.randint(300,500)
-            self.rect = pygame.Rect(x, y, 30, 30)
+            self.fallsp = rng.randint(300,500)
+        self.rect = pygame.Rect(x, y, width, height)  # Add rect for collision
+        self.prev_y = self.rect.y  # last tick's y, for render interpolation
+
+    @property
+    def kind(self):
+        return HAZARD_KINDS.get(self.obst_type, HAZARD_KINDS["rock"])
+
+    @property
+    def damage(self):
+        return self.kind[1]
+
+    @property
+    def sprite(self):
+        return hazard_sprite(self.kind[0])
     
     def update(self, dt):
         # Update hazard position
+        self.prev_y = self.rect.y
         if self.obst_type in ["icicle", "rock"] and self.active:
             self.rect.y += self.fallsp * dt
             
@@ -295,339 +931,3340 @@ class Hazard:
             screen.blit(self.sprite, self.rect)
 
 
-class HazardManager:
-    # Manages spawning and updating hazards
-    # Handles avalanche timer and warnings
-    
-    def __init__(self):
-        self.hazards = []
-        self.spawn_timer = 0
-        self.spawn_interval = 2.0  # seconds between spawns
-        self.avalanche_timer = 60.0  # 60 seconds until avalanche
-        self.avalanche_active = False
-        self.avalanche_warning = False
-        self.warning_flash = 0
-    
-    def update(self, dt, player_x):
-        # Update spawn timer
-        self.spawn_timer += dt
-        
-        # Spawn random hazards if timer reached
-        if self.spawn_timer >= self.spawn_interval and not self.avalanche_active:
-            self.spawn_timer = 0
-            self.spawn_hazard(player_x)
-        
-        # Update avalanche timer
-        self.avalanche_timer -= dt
-        
-        # Check for avalanche warning
-        if not self.avalanche_warning and self.avalanche_timer <= 10:
-            self.avalanche_warning = True
-        
-        # Activate avalanche if timer reaches 0
-        if self.avalanche_timer <= 0 and not self.avalanche_active:
-            self.act_avalanche()
-        
-        # Update all hazards
-        for hazard in self.hazards[:]:  # Copy list for safe removal
-            hazard.update(dt)
-            if not hazard.active:
-                self.hazards.remove(hazard)
-
-    def spawn_hazard(self, player_x):
-        """Spawn a random hazard above the player"""
-        hazard_type = random.choice(["icicle", "rock"])
-        spawn_x = player_x + random.randint(-100, 100)
-        spawn_x = max(0, min(spawn_x, 780))  # Keep on screen
-        
-        new_hazard = Hazard(spawn_x, -50, hazard_type)
-        self.hazards.append(new_hazard)
+# Per-type hazard data shared by every hazard of that type
+# name -> (type code, damage, width, height)
+HAZARD_KINDS = {
+    "icicle": (0, 10, 20, 40),
+    "rock": (1, 15, 30, 30),
+    "avalanche": (2, 999, 800, 100),
+}
+HAZARD_NAMES = ["icicle", "rock", "avalanche"]
+AVALANCHE = HAZARD_KINDS["avalanche"][0]
 
-    def act_avalanche(self):
-        """Time's up! Time for the avalanche to kill you!"""
-        if not self.avalanche_active:
-            self.avalanche_active = True
-            avalanche = Hazard(0, -100, "avalanche")
-            avalanche.active = True
-            self.hazards.append(avalanche)
-            print("Tick Tock, an avalanche is coming")
 
-    def check_collisions(self, player):
-        """Check collisions between player and all hazards"""
-        for hazard in self.hazards:
-            if hazard.active and player.rect.colliderect(hazard.rect):
-                # Damage player if not invincible
-                if player.damage(hazard.damage):
-                    print(f"Hit by {hazard.obst_type}! Health: {player.health}")
-                    
-                    # Remove small hazards on hit
-                    if hazard.obst_type in ["icicle", "rock"]:
-                        hazard.active = False
-                
-                # Avalanche is instant death
-                if hazard.obst_type == "avalanche":
-                    return True
-        
-        return False
+def hazard_sprite_name(type_code):
+    # every kind has a sprite the size of its box, so the mask lines up with the rect test
+    return HAZARD_NAMES[type_code]
 
-    def draw(self, screen):
-        """Draw all hazards"""
-        for hazard in self.hazards:
-            hazard.draw(screen)
-        
-        # Draw avalanche warning
-        if self.avalanche_warning and not self.avalanche_active:
-            # Flashing warning
-            if int(pygame.time.get_ticks() / 500) % 2 == 0:
-                font = pygame.font.Font(None, 48)
-                warning = font.render(f"AVALANCHE IN {int(self.avalanche_timer)}s!", True, (255, 50, 50))
-                screen.blit(warning, (200, 50))
 
-class WeatherSystem:
-    # wind_force/direction
-    # snow_intensity (affects visibility)
-    def __init__(self):
-        self.wind_force = 0.0
-        self.snow_intensity = 2
-        self.wind = True
-    
-    def update_wind():
-        if random.random() < 0.01:
-            return random.choice([-3,0,3])
-        else:
-            return 0
+def hazard_sprite(type_code):
+    return assets.get(hazard_sprite_name(type_code))
 
 
+def hazard_mask(type_code):
+    return assets.mask(hazard_sprite_name(type_code))
 
-# ==========
-# FUNCTIONS
-# ==========
 
+class HazardPool:
+    # Structure-of-arrays storage for hazards
+    # Every hazard is a slot in a set of NumPy arrays, so a whole storm moves in
+    # one array operation. Dead slots go on a free list and get reused, nothing
+    # is ever removed from the middle of a list.
 
+    WIND_DRIFT = 0.5  # px/s of sideways drift per unit of wind, they're heavy
 
+    def __init__(self, capacity=256):
+        self.capacity = 0
+        self.x = np.zeros(0)
+        self.y = np.zeros(0)
+        self.prev_y = np.zeros(0)  # last tick's y, for render interpolation
+        self.w = np.zeros(0)
+        self.h = np.zeros(0)
+        self.fallsp = np.zeros(0)
+        self.damage = np.zeros(0, dtype=np.int32)
+        self.type = np.zeros(0, dtype=np.int8)
+        self.active = np.zeros(0, dtype=bool)
+        self.free = []
+        self.high = 0  # slots at or above this index have never been used
+        self.count = 0
+        self._grow(capacity)
 
-def ice_physics(player, platform):
-    # Reduced friction, sliding mechanics
-    player.velocity.x *= 0.95
+    def __len__(self):
+        return self.count
 
-def check_base_collisions(player, terrain):
-    # baseplate collisions (feet, head, sides)
-    # Slope handling for mountain angles
-    # Climbing surface contact
-    
-    if player.rect.colliderect(terrain.rect):
-        player.position.y = terrain.rect.top - player.rect.height  # Move above terrain
-        player.rect.bottom = terrain.rect.top  # Align with terrain
-        player.velocity.y = 0  # Stop falling
-        player.is_grounded = True
-        
+    def _grow(self, capacity):
+        old = self.capacity
+        for name in ("x", "y", "prev_y", "w", "h", "fallsp", "damage", "type", "active"):
+            arr = getattr(self, name)
+            grown = np.zeros(capacity, dtype=arr.dtype)
+            grown[:old] = arr
+            setattr(self, name, grown)
+        # pop() hands out the lowest slots first
+        self.free = list(range(capacity - 1, old - 1, -1)) + self.free
+        self.capacity = capacity
 
+    def spawn(self, x, y, obst_type="icicle", fallsp=None, rng=random):
+        """Add a hazard and return its slot"""
+        type_code, damage, w, h = HAZARD_KINDS.get(obst_type, HAZARD_KINDS["rock"])
+        if fallsp is None:
+            fallsp = 200 if type_code == AVALANCHE else rng.randint(300, 500)
 
-def check_hazards(player, hazards):
-    # Crevasse detection
-    # Falling object collisions
-    # Avalanche zone detection
-    
-    if player.rect.colliderect(hazards.rect):
-        return True
+        if not self.free:
+            self._grow(self.capacity * 2)
+        i = self.free.pop()
 
+        self.x[i] = x
+        self.y[i] = self.prev_y[i] = y
+        self.w[i] = w
+        self.h[i] = h
+        self.fallsp[i] = fallsp
+        self.damage[i] = damage
+        self.type[i] = type_code
+        self.active[i] = True
+        self.count += 1
+        if i >= self.high:
+            self.high = i + 1
+        return i
 
-def generate_mountain_section(surfacelist):
-    # Procedural or hand-crafted level sections
-    # Mix of platforms, climbs, hazards
-    platforms_list = []
-    multx1 = 75
-    multx2 = 100
-    multy1 = 425
-    multy2 = 450
-    for fac in range(12):
-        x = random.randint(multx1,multx2)
-        y = random.randint(multy1,multy2)
-        w = random.randint(80,200)
-        h = random.randint(15,50)
-        surf = random.choice(surfacelist)
-        multx1 += 200
-        multx2 += 200
-        multy1 -= 50
-        multy2 -= 50
-        platforms_list.append(Platform(x,y,w,h,surf))
+    def despawn(self, i):
+        if self.active[i]:
+            self.active[i] = False
+            self.free.append(i)
+            self.count -= 1
 
-    return platforms_list
+    def clear(self):
+        self.active[:] = False
+        self.free = list(range(self.capacity - 1, -1, -1))
+        self.high = 0
+        self.count = 0
 
+    def update(self, dt, bottom=600):
+        n = self.high
+        if not self.count:
+            return
+        y = self.y[:n]
+        self.prev_y[:n] = y
+        y += self.fallsp[:n] * dt
 
+        # icicles and rocks die once they leave the screen, the avalanche keeps going
+        gone = self.active[:n] & (y > bottom)
+        if gone.any():
+            gone &= self.type[:n] != AVALANCHE
+            gone = gone.nonzero()[0]
+            self.active[gone] = False
+            self.free.extend(gone.tolist())
+            self.count -= len(gone)
 
+    def active_slots(self):
+        return self.active[:self.high].nonzero()[0]
 
-def camera_follow(player, screen_width):
-    # Smooth camera tracking
-    global camera_x
+    def drift(self, dt, weather):
+        """Blow icicles and rocks sideways with the wind where each one is"""
+        n = self.high
+        if not self.count:
+            return
+        wind = weather.wind_array(self.x[:n], self.y[:n], smooth=False)
+        wind *= self.WIND_DRIFT * dt
+        wind[self.type[:n] == AVALANCHE] = 0.0
+        self.x[:n] += wind
 
-    # Center player horizontally
-    target_x = -player.rect.centerx + 400  # 400 = half of 800px screen
-    
-    # Simple follow (no smoothing for jam)
-    camera_x = target_x
-    
-    # Keep in bounds
-    camera_x = min(0, camera_x)  # Don't show left of level start
-    camera_x = max(-(level_width - 800), camera_x)  # Don't show right of level end
-    
-    return camera_x
+    def overlapping(self, rect):
+        """Slots of active hazards whose box overlaps rect"""
+        n = self.high
+        if not self.count:
+            return ()
+        x = self.x[:n]
+        y = self.y[:n]
+        hit = self.active[:n] & (x < rect.right) & (x + self.w[:n] > rect.left) \
+            & (y < rect.bottom) & (y + self.h[:n] > rect.top)
+        return hit.nonzero()[0]
 
-def draw_health_bar(screen, player):
-    # Draw player health bar
-    bar_width = 200
-    bar_height = 20
-    bar_x = 10
-    bar_y = 10
-    
-    # Background
-    pygame.draw.rect(screen, (50, 50, 50), (bar_x, bar_y, bar_width, bar_height))
-    
-    # Health fill
-    health_width = (player.health / player.max_health) * bar_width
-    health_color = (0, 255, 0) if player.health > 50 else (255, 255, 0) if player.health > 25 else (255, 0, 0)
-    pygame.draw.rect(screen, health_color, (bar_x, bar_y, health_width, bar_height))
-    
-    # Border
-    pygame.draw.rect(screen, (255, 255, 255), (bar_x, bar_y, bar_width, bar_height), 2)
-    
-    # Health text
-    font = pygame.font.Font(None, 24)
-    health_text = font.render(f"Health: {player.health}/{player.max_health}", True, (255, 255, 255))
-    screen.blit(health_text, (bar_x + 5, bar_y + 2))
+    def rect(self, i):
+        return pygame.Rect(int(self.x[i]), int(self.y[i]), int(self.w[i]), int(self.h[i]))
 
-def draw_timer(screen, hazard_manager):
-    # Draw avalanche timer
-    font = pygame.font.Font(None, 36)
-    
-    if hazard_manager.avalanche_active:
-        timer_text = font.render("AVALANCHE!", True, (255, 50, 50))
-    elif hazard_manager.avalanche_warning:
-        timer_text = font.render(f"Avalanche: {int(hazard_manager.avalanche_timer)}s", True, (255, 150, 50))
-    else:
-        timer_text = font.render(f"Avalanche: {int(hazard_manager.avalanche_timer)}s", True, (255, 255, 255))
-    
-    screen.blit(timer_text, (600, 10))
 
+class AvalancheFlow:
+    # Falling-sand avalanche on a grid of CELL px cells covering a fixed patch
+    # of the world. Each tick every run of snow with open air under it drops a
+    # cell, and snow that's resting slides down-left or down-right if there's
+    # room (the order flips every tick so piles stay symmetric), all as
+    # whole-array NumPy ops.
+    # Only the rows where something moved last tick (plus one above) are
+    # updated, so settled snow costs nothing. Snow pours in along the top for
+    # FEED_TIME seconds, piles up on platforms and drops out of the bottom.
+    # It steps at its own fixed RATE whatever the sim's tick rate, snow moves
+    # a cell per step so the avalanche is as fast at 30 Hz as at 120 Hz.
 
+    CELL = 4
+    RATE = 60  # steps per second
+    FEED_ROWS = 25  # the slab it starts as, 100 px like the old avalanche sprite
+    FEED_TIME = 10.0
+    BURY_FRACTION = 0.25  # of the cells under the player, any more and they're buried
+    COLOR = (240, 245, 255)
 
+    def __init__(self, left, top, cols=200, rows=200):
+        cell = self.CELL
+        self.rect = pygame.Rect(left, top, cols * cell, rows * cell)
+        self.snow = np.zeros((rows, cols), bool)
+        self.solid = np.zeros((rows, cols), bool)
+        self.snow[:self.FEED_ROWS] = True
+        self.feed_ticks = round(self.FEED_TIME * self.RATE)
+        self.lo, self.hi = 0, self.FEED_ROWS  # rows that might move next step
+        self.ticks = 0  # steps so far
+        self.pending = 0.0  # steps owed by the time passed, not taken yet
+        self.surface = None  # rendered grid, one pixel per cell
+        self.scaled = None
+        self.drawn_tick = None
 
+    def add_solids(self, platforms):
+        """Mark the cells platforms cover as solid, snow piles up on them"""
+        cell = self.CELL
+        left, top = self.rect.topleft
+        for p in platforms:
+            r = p.rect.clip(self.rect)
+            if r.w and r.h:
+                r0, c0 = (r.top - top) // cell, (r.left - left) // cell
+                r1, c1 = -((top - r.bottom) // cell), -((left - r.right) // cell)
+                self.solid[r0:r1, c0:c1] = True
+        self.snow &= ~self.solid
 
-# =========================
-# MAIN GAME LOOP
-# =========================
+    @property
+    def settled(self):
+        return self.lo >= self.hi
 
+    def update(self, dt):
+        """Advance dt seconds of snow flow, in whole steps"""
+        self.pending += dt * self.RATE
+        steps = int(self.pending + 1e-9)  # a 1/60 s tick is one step, not 0.999...
+        self.pending -= steps
+        for _ in range(steps):
+            self.step()
 
-def main():
-    surfacelist = ["ice","rock"]
-    pygame.init()
-    screen = pygame.display.set_mode((800, 600))
-    pygame.display.set_caption("Arctic Platformer")
-    clock = pygame.time.Clock()
+    def step(self):
+        """One step of snow flow"""
+        snow = self.snow
+        rows = len(snow)
+        self.ticks += 1
+        if self.ticks <= self.feed_ticks:
+            # pour in at the top, alternate columns so it falls as a stream of grains
+            snow[0, self.ticks % 2::2] |= ~self.solid[0, self.ticks % 2::2]
+            self.lo = 0
+        snow[-1] = False  # out of the bottom of the patch
+        lo, hi = self.lo, min(self.hi, rows - 1)
+        if lo >= hi:
+            return
 
+        # a snow cell falls if the first non-snow cell under it is open air, so
+        # a whole column drops together instead of one cell at a time
+        window = snow[lo:hi + 1]
+        n = hi + 1 - lo
+        gaps = np.where(window, n, np.arange(n)[:, None])
+        first_gap = np.minimum.accumulate(gaps[::-1], axis=0)[::-1][1:]
+        # no gap inside the window means it sits on settled snow
+        air = np.vstack((~self.solid[lo:hi + 1], np.zeros((1, window.shape[1]), bool)))
+        src = window[:-1]
+        below = window[1:]
+        fall = src & np.take_along_axis(air, first_gap, axis=0)
+        src &= ~fall
+        below |= fall
+        moved = fall.any(axis=1)
 
-    player = Player(playersp)
-    terrain = Platform(0,580,300,300,"rock")
-    goal = Platform(350,200,100,20,"rock")
-    hazard_manager = HazardManager()
-    setup_player_gravity(player)
-    weather = WeatherSystem()
-    weather.wind_force = 40.0  # 0 = no wind, can tweak the wind however
-    plats = generate_mountain_section(surfacelist)
+        blocked = self.solid[lo + 1:hi + 1]
 
-    # Win Condition
+        for right in ((True, False) if self.ticks % 2 else (False, True)):
+            full = below | blocked
+            if right:  # (r, c) -> (r + 1, c + 1)
+                slide = src[:, :-1] & full[:, :-1] & ~full[:, 1:]
+                src[:, :-1] &= ~slide
+                below[:, 1:] |= slide
+            else:  # (r, c) -> (r + 1, c - 1)
+                slide = src[:, 1:] & full[:, 1:] & ~full[:, :-1]
+                src[:, 1:] &= ~slide
+                below[:, :-1] |= slide
+            moved |= slide.any(axis=1)
 
+        # next tick: from a row above the highest move to a row below the lowest landing
+        active = moved.nonzero()[0]
+        if len(active):
+            self.lo = max(0, lo + int(active[0]) - 1)
+            self.hi = lo + int(active[-1]) + 2
+        else:
+            self.lo = self.hi = 0
 
-    game_won = False
-    game_over = False
+    def buries(self, rect):
+        """True if enough snow covers rect"""
+        cell = self.CELL
+        left, top = self.rect.topleft
+        r0, c0 = (rect.top - top) // cell, (rect.left - left) // cell
+        r1, c1 = -((top - rect.bottom) // cell), -((left - rect.right) // cell)
+        cells = (r1 - r0) * (c1 - c0)
+        under = self.snow[max(0, r0):max(0, r1), max(0, c0):max(0, c1)]
+        return under.size > 0 and np.count_nonzero(under) >= self.BURY_FRACTION * cells
 
-    font = pygame.font.Font(None, 36)
+    def draw(self, screen, camera_offset=(0, 0)):
+        """Draw the snow, returns the screen rect it covered"""
+        if self.drawn_tick != self.ticks:
+            self.drawn_tick = self.ticks
+            rows, cols = self.snow.shape
+            if self.surface is None:
+                self.surface = pygame.Surface((cols, rows), 0, 32)
+                self.scaled = pygame.Surface(self.rect.size, 0, 32)
+                self.scaled.set_colorkey((0, 0, 0))
+                self.color = self.surface.map_rgb(self.COLOR)
+            # straight into the pixels, transposed since surfarray is (x, y)
+            pixels = pygame.surfarray.pixels2d(self.surface)
+            pixels[...] = 0
+            pixels[self.snow.T] = self.color
+            del pixels  # unlocks the surface
+            pygame.transform.scale(self.surface, self.rect.size, self.scaled)
+        return screen.blit(self.scaled, (self.rect.x + camera_offset[0], self.rect.y + camera_offset[1]))
 
-    running = True
-    while running:
-        dt = clock.tick(60) / 1000.0  # seconds
 
-        jump_pressed = False
-        jump_held = False
+class HazardManager:
+    # Manages spawning and updating hazards
+    # Handles avalanche timer and warnings
+    # Hazards spawn a screen above the player and die just below them,
+    # so they keep coming wherever the camera has scrolled to
+    # Spawns, the warning and the avalanche are all timers on the sim's
+    # TimerWheel, so nothing here counts down by hand every frame.
 
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            elif event.type == pygame.KEYDOWN: 
-                if event.key == pygame.K_SPACE:
-                    jump_pressed = True
-                    player.is_grounded = False
+    SPAWN_ABOVE = 590  # px above the player's top
+    DESPAWN_BELOW = 60  # px below the player's top
+    WARNING_TIME = 10.0  # seconds of warning before the avalanche
+    PIXEL_COLLISIONS = True  # hits need the sprites' opaque pixels to touch, not just the boxes
 
+    def __init__(self, events, rng=random, avalanche_time=60.0, solids=None, verbose=True):
+        self.events = events
+        self.rng = rng  # everything random about hazards comes from here
+        self.verbose = verbose  # print hits and the avalanche starting
+        self.solids = solids or (lambda rect: ())  # rect -> platforms there, for the avalanche to pile on
+        self.pool = HazardPool()
+        self.avalanche = None  # AvalancheFlow once it's started
+        self.spawn_interval = 2.0  # seconds between spawns
+        self.avalanche_active = False
+        self.avalanche_warning = False
+        self.player_x = 100
+        self.player_y = 540
+        self.spawn_timer = events.every(self.spawn_interval, self.spawn_near_player)
+        self.warning_timer = self.avalanche_start = None
+        self.spawner_timers = {}  # HazardSpawner -> its repeating Timer
+        self.avalanche_timer = avalanche_time
 
-        keys = pygame.key.get_pressed()
-        jump_held = keys[pygame.K_SPACE]
+    @property
+    def avalanche_timer(self):
+        """Seconds until the avalanche"""
+        return self.events.remaining(self.avalanche_start)
 
-        # skip if game over/won
+    @avalanche_timer.setter
+    def avalanche_timer(self, seconds):
+        events = self.events
+        events.cancel(self.warning_timer)
+        events.cancel(self.avalanche_start)
+        self.avalanche_start = events.after(seconds, self.start_avalanche)
+        if seconds > self.WARNING_TIME:
+            self.warning_timer = events.after(seconds - self.WARNING_TIME, self.warn)
+        else:
+            self.warning_timer = None
+            self.avalanche_warning = True
 
-        if not (game_won or game_over):
-            moving = False
-            mv_speed = player.move_speed * dt
-            if keys[pygame.K_LEFT] or keys[pygame.K_a]:
-                player.position.x -= mv_speed
-                moving = True
-        
-            if keys[pygame.K_RIGHT] or keys[pygame.K_d]:
-                player.position.x += mv_speed
-                moving = True
-
-            # collisions (my absolute worst nightmare)
-            for p in plats:
-                if player.rect.colliderect(p.rect):
-                    player.position.y = p.rect.top - player.rect.height
-                    player.rect.bottom = p.rect.top
-                    player.is_grounded = True
-                    player.velocity.y = 0  
-                    cur = p
+    def set_spawners(self, spawners):
+        """Start timers for newly streamed in spawners, stop the ones that streamed out"""
+        timers = self.spawner_timers
+        live = set(spawners)
+        for s in [s for s in timers if s not in live]:
+            self.events.cancel(timers.pop(s))
+        for s in spawners:
+            if s not in timers:
+                # aligned, so spawners with the same interval drop together
+                timers[s] = self.events.every(s.interval, self.pool.spawn, s.x, s.y, s.obst_type, None, self.rng,
+                                              aligned=True)
 
-                    # check if on ice
-                    if p.surface == "ice":
-                        player.is_sliding = True
-                
-            if player.is_sliding == True:
-                ice_physics(player,cur)
+    def update(self, dt, player_x, player_y=540, weather=None):
+        # where timed spawns should happen this tick
+        self.player_x = player_x
+        self.player_y = player_y
+        # Update all hazards
+        self.pool.update(dt, player_y + self.DESPAWN_BELOW)
+        if weather is not None:
+            self.pool.drift(dt, weather)
+        if self.avalanche is not None:
+            self.avalanche.update(dt)
 
-            check_base_collisions(player, terrain)
+    def spawn_near_player(self):
+        self.spawn_hazard(self.player_x, self.player_y)
 
-            apply_gravity(player, dt, jump_pressed, jump_held, wind_x=weather.wind_force)
+    def warn(self):
+        self.avalanche_warning = True
 
-            # =====================
-            # HAZARDS
-            # =====================
-            hazard_manager.update(dt, player.position.x)
-            hazard_manager.check_collisions(player)
-            
-            # =====================
-            # WIN/LOSE CONDITIONS
-            # =====================
-            if player.rect.colliderect(goal.rect):
-                game_won = True
-            
-            if player.health <= 0 or hazard_manager.avalanche_active and player.rect.colliderect(hazard_manager.hazards[-1].rect):
-                game_over = True
-            
-            # Update player (invincibility timer)
-            player.update(dt)
+    def start_avalanche(self):
+        self.act_avalanche(self.player_x, self.player_y)
 
-            # Draw! This is not C so thankfully there should be no memory leaks here
-            screen.blit(background, (0, 0))
-            screen.blit(player.sprite, player.rect)
+    def spawn_hazard(self, player_x, player_y=540):
+        """Spawn a random hazard above the player"""
+        hazard_type = self.rng.choice(["icicle", "rock"])
+        spawn_x = player_x + self.rng.randint(-100, 100)
+        spawn_x = max(0, spawn_x)  # Not left of the level start
+        
+        self.pool.spawn(spawn_x, player_y - self.SPAWN_ABOVE, hazard_type, rng=self.rng)
 
-            terrain.draw(screen)
+    def act_avalanche(self, player_x=100, player_y=540):
+        """Time's up! Time for the avalanche to kill you!"""
+        if not self.avalanche_active:
+            self.avalanche_active = True
+            self.events.cancel(self.spawn_timer)  # no more random hazards
+            # a screen wide, centred on the player, pouring down from just above the screen
+            self.avalanche = AvalancheFlow(max(0, player_x - 400), player_y - self.SPAWN_ABOVE - 50)
+            self.avalanche.add_solids(self.solids(self.avalanche.rect))
+            if self.verbose:
+                print("Tick Tock, an avalanche is coming")
 
-            for p in plats:
-                p.draw(screen)
+    def check_collisions(self, player):
+        """Check collisions between player and all hazards"""
+        # Buried by the avalanche is instant death
+        if self.avalanche is not None and self.avalanche.buries(player.rect):
+            return True
+        pool = self.pool
+        hits = pool.overlapping(player.rect)
+        if self.PIXEL_COLLISIONS and len(hits):
+            hits = self.touching(player, hits)
+        for i in hits:
+            type_code = pool.type[i]
+            # Damage player if not invincible
+            if player.damage(int(pool.damage[i])):
+                if self.verbose:
+                    print(f"Hit by {HAZARD_NAMES[type_code]}! Health: {player.health}")
+
+                # Remove small hazards on hit
+                if type_code != AVALANCHE:
+                    pool.despawn(i)
+
+            # Avalanche is instant death
+            if type_code == AVALANCHE:
+                return True
+
+        return False
+
+    def touching(self, player, slots):
+        """Narrow phase: the slots (already overlapping the player's rect) whose sprite pixels touch the player's"""
+        pool = self.pool
+        player_mask = assets.mask("player")
+        px, py = player.rect.topleft
+        return [i for i, x, y, type_code in zip(slots.tolist(), pool.x[slots].tolist(), pool.y[slots].tolist(),
+                                                 pool.type[slots].tolist())
+                if player_mask.overlap(hazard_mask(type_code), (int(x) - px, int(y) - py))]
+
+
+class WindField:
+    # Tileable value noise (a few octaves on wrapping lattices) baked once
+    # into a SIZE x SIZE table, one texel per CELL px of world, values -1..1.
+    # Reads are bilinear where a smooth value matters (the player) and a
+    # single lookup per point for crowds (hazards, penguins, snowflakes).
+
+    SIZE = 256  # power of two, so wrapping is a mask
+    CELL = 16
+
+    def __init__(self, seed=0, octaves=3):
+        self.table = self.bake(seed, octaves)
+        self.flat = self.table.ravel()
+
+    @classmethod
+    def bake(cls, seed, octaves=3, lattice=8):
+        size = cls.SIZE
+        rng = np.random.default_rng(seed)
+        table = np.zeros((size, size), np.float32)
+        texels = np.arange(size)
+        amplitude = 1.0
+        for _ in range(octaves):
+            grid = rng.uniform(-1.0, 1.0, (lattice, lattice)).astype(np.float32)
+            step = size // lattice
+            i0 = texels // step
+            i1 = (i0 + 1) % lattice  # wraps, so the table tiles
+            t = (texels % step / step).astype(np.float32)
+            t = t * t * (3 - 2 * t)
+            rows = grid[i0] * (1 - t)[:, None] + grid[i1] * t[:, None]
+            table += amplitude * (rows[:, i0] * (1 - t) + rows[:, i1] * t)
+            amplitude *= 0.5
+            lattice *= 2
+        table /= np.abs(table).max()
+        return table
+
+    def at(self, u, v):
+        """Bilinear read at one point in texels"""
+        mask = self.SIZE - 1
+        u0 = math.floor(u)
+        v0 = math.floor(v)
+        fu = u - u0
+        fv = v - v0
+        u0 &= mask
+        v0 &= mask
+        u1 = (u0 + 1) & mask
+        v1 = (v0 + 1) & mask
+        table = self.table
+        top = table.item(v0, u0) * (1 - fu) + table.item(v0, u1) * fu
+        bottom = table.item(v1, u0) * (1 - fu) + table.item(v1, u1) * fu
+        return top * (1 - fv) + bottom * fv
+
+    def sample(self, u, v):
+        """Bilinear reads at arrays of points in texels"""
+        mask = self.SIZE - 1
+        u0 = np.floor(u)
+        v0 = np.floor(v)
+        fu = (u - u0).astype(np.float32)
+        fv = (v - v0).astype(np.float32)
+        u0 = u0.astype(np.int64) & mask
+        v0 = v0.astype(np.int64) & mask
+        u1 = (u0 + 1) & mask
+        v1 = (v0 + 1) & mask
+        table = self.table
+        top = table[v0, u0] * (1 - fu) + table[v0, u1] * fu
+        bottom = table[v1, u0] * (1 - fu) + table[v1, u1] * fu
+        return top * (1 - fv) + bottom * fv
+
+    def nearest(self, u, v):
+        """One lookup per point, for things too many and too small to need smoothing"""
+        size = self.SIZE
+        ui = np.floor(u).astype(np.intp)
+        vi = np.floor(v).astype(np.intp)
+        return self.flat[np.ravel_multi_index((vi, ui), (size, size), mode="wrap")]
+
+
+class WeatherSystem:
+    # wind_force/direction
+    # snow_intensity (affects visibility), SnowParticles keeps this many
+    # SnowParticles.FLAKES_PER_INTENSITY flakes on screen
+    # The wind isn't the same everywhere: wind_force is the average, and a
+    # WindField drifting downwind adds gusts and calm pockets on top, so
+    # anything can ask for the wind where it is with wind_at/wind_array.
+
+    GUST_SPEED = 150.0  # px/s the gusts travel downwind
+    CHURN = 12.0  # px/s the field slides across itself, so gusts change shape
+
+    def __init__(self, rng=random):
+        self.rng = rng
+        self.wind_force = 0.0
+        self.gustiness = 1.0  # gusts and lulls swing this fraction of wind_force either way, 1 = dead calm pockets
+        self.snow_intensity = 2
+        self.wind = True
+        self.field = WindField(rng.getrandbits(32))
+        self.time = 0.0
+
+    def update_wind(self, dt):
+        self.time += dt
+
+    def _texels(self, x, y):
+        inv_cell = 1.0 / WindField.CELL
+        drift = self.GUST_SPEED * self.time * (1 if self.wind_force >= 0 else -1)
+        return (x - drift) * inv_cell, (y + self.CHURN * self.time) * inv_cell
+
+    def wind_at(self, x, y):
+        """Wind at one world position"""
+        if not self.wind:
+            return 0.0
+        u, v = self._texels(x, y)
+        return self.wind_force * (1 + self.gustiness * self.field.at(u, v))
+
+    def wind_array(self, x, y, smooth=True):
+        """Wind at arrays of world positions, smooth=False for one cheap lookup each"""
+        if not self.wind:
+            return np.zeros(np.shape(x), np.float32)
+        u, v = self._texels(x, y)
+        noise = self.field.sample(u, v) if smooth else self.field.nearest(u, v)
+        noise *= self.wind_force * self.gustiness
+        noise += self.wind_force
+        return noise
+
+
+
+# =========================
+# PENGUIN HUDDLE
+# =========================
+
+PENGUIN_W, PENGUIN_H = SPRITES["penguin"][1]
+
+
+class PenguinHuddle:
+    # A colony of penguins on a strip of ground, huddling for warmth.
+    # x runs along the strip and z into the screen (0 = front), so the
+    # crowd moves in 2D without anyone standing on anyone's head.
+    # Flocking rules (cohesion, separation, alignment) plus wind and falling
+    # hazards, with every penguin's state in NumPy arrays. Neighbours come
+    # from a uniform grid of RADIUS cells, built by sorting penguins by cell,
+    # so a step is O(penguins + neighbour pairs) instead of O(penguins^2).
+
+    RADIUS = 40.0  # px, who counts as a neighbour (and the grid cell size)
+    PERSONAL = 20.0  # px, closer than this and they shove
+    COHESION = 4.0  # pull towards the neighbours' middle, scaled by how cold they are
+    SEPARATION = 600.0
+    ALIGNMENT = 1.5
+    WARM_NEIGHBOURS = 6  # this many neighbours and you're fully sheltered
+    HEAT = 0.25  # warmth/s gained when sheltered
+    CHILL = 0.08  # warmth/s lost in still air, more in wind
+    WIND_CHILL = 40.0  # wind_force that doubles the chill
+    WIND_PUSH = 0.5  # how much of the wind an exposed penguin walks with
+    FLEE_RADIUS = 64.0  # px each side of a falling hazard
+    FLEE = 400.0
+    DAMPING = 2.0  # 1/s
+    MAX_SPEED = 60.0  # px/s, they're penguins
+    DEPTH_SQUASH = 0.25  # screen px up per px of z
+
+    def __init__(self, count, left, right, ground_y, depth=60.0, rng=None):
+        rng = rng if rng is not None else np.random.default_rng()
+        self.left = left
+        self.right = right
+        self.ground_y = ground_y
+        self.depth = depth
+        self.x = rng.uniform(left, right - PENGUIN_W, count)
+        self.z = rng.uniform(0, depth, count)
+        self.vx = np.zeros(count)
+        self.vz = np.zeros(count)
+        self.warmth = rng.uniform(0.3, 0.7, count)
+        self.neighbours = np.zeros(count, np.intp)
+
+    def __len__(self):
+        return len(self.x)
+
+    def neighbour_pairs(self):
+        """
+        (i, j) index arrays of every pair of penguins in the same or adjacent
+        grid cells. Each pair comes up once, so only half the neighbourhood
+        (own cell, above, and the column to the right) is searched.
+        """
+        n = len(self.x)
+        per_cell = 1.0 / self.RADIUS
+        cx = ((self.x - self.left) * per_cell).astype(np.int64)  # everyone is right of left, so this floors
+        cz = (self.z * per_cell).astype(np.int64)
+        stride = int(self.depth * per_cell) + 3  # a spare z cell each side so dz = +-1 never wraps a column
+        key = (cx - cx.min() + 1) * stride + cz + 1  # and a spare column each side for dx = +-1
+        order = np.argsort(key)
+
+        # dense table of where each cell's penguins start in order, and how many there are
+        cell_counts = np.bincount(key, minlength=key.max() + stride + 2)
+        cell_starts = np.cumsum(cell_counts) - cell_counts
+
+        everyone = np.arange(n)
+        pairs_i = []
+        pairs_j = []
+        for dcx, dcz in ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1)):
+            target = key + dcx * stride + dcz
+            start = cell_starts[target]
+            counts = cell_counts[target]
+            total = int(counts.sum())
+            if not total:
+                continue
+            # penguin i paired with each of the counts[i] penguins in that cell
+            first = np.repeat(start - (np.cumsum(counts) - counts), counts)
+            i = np.repeat(everyone, counts)
+            j = order[first + np.arange(total)]
+            if dcx == dcz == 0:
+                keep = i < j  # own cell: each pair once, and not with themselves
+                i = i[keep]
+                j = j[keep]
+            pairs_i.append(i)
+            pairs_j.append(j)
+        if not pairs_i:
+            return everyone[:0], everyone[:0]
+        return np.concatenate(pairs_i), np.concatenate(pairs_j)
+
+    def update(self, dt, wind=0.0, hazard_xs=()):
+        """One step of huddling, wind is one value or one per penguin, hazard_xs are centres of hazards falling towards the colony"""
+        n = len(self.x)
+        if n == 0:
+            return
+        x, z, vx, vz = self.x, self.z, self.vx, self.vz
+
+        i, j = self.neighbour_pairs()
+        dx = x[j] - x[i]
+        dz = z[j] - z[i]
+        d2 = dx * dx + dz * dz
+        near = np.flatnonzero(d2 < self.RADIUS ** 2)
+        # both ways round from here on, i is who's affected and j the neighbour
+        i, j = np.concatenate((i[near], j[near])), np.concatenate((j[near], i[near]))
+        dx = np.concatenate((dx[near], -dx[near]))
+        dz = np.concatenate((dz[near], -dz[near]))
+        d2 = np.concatenate((d2[near], d2[near]))
+
+        count = np.bincount(i, minlength=n)
+        self.neighbours = count
+        per = 1.0 / np.maximum(count, 1)
+        sheltered = np.minimum(count / self.WARM_NEIGHBOURS, 1.0)
+
+        # cohesion: the colder, the harder they head for the middle of their neighbours
+        pull = self.COHESION * (1.0 - self.warmth) * per
+        ax = pull * np.bincount(i, dx, n)
+        az = pull * np.bincount(i, dz, n)
+        # and the exposed ones head for the colony as a whole
+        exposed = (1.0 - sheltered) * self.COHESION * (1.0 - self.warmth) * self.RADIUS
+        ax += exposed * np.sign(x.mean() - x)
+        az += exposed * np.sign(z.mean() - z)
+
+        # separation: shove away from anyone inside personal space
+        close = d2 < self.PERSONAL ** 2
+        if close.any():
+            dist = np.sqrt(d2[close]) + 1e-6
+            shove = self.SEPARATION * (1.0 - dist / self.PERSONAL) / dist
+            ax -= np.bincount(i[close], dx[close] * shove, n)
+            az -= np.bincount(i[close], dz[close] * shove, n)
+
+        # alignment: waddle the way the neighbours waddle
+        has = count > 0
+        ax += self.ALIGNMENT * (np.bincount(i, vx[j], n) * per - vx) * has
+        az += self.ALIGNMENT * (np.bincount(i, vz[j], n) * per - vz) * has
+
+        # wind: the exposed ones walk with it round to the sheltered side,
+        # which keeps the huddle slowly rolling downwind like the real thing
+        ax += wind * self.WIND_PUSH * (1.0 - sheltered)
+
+        # falling hazards scatter anyone underneath
+        if len(hazard_xs):
+            ax += self.flee(np.asarray(hazard_xs, float))
+
+        # warmth: neighbours warm you, wind chills you
+        chill = self.CHILL * (1.0 + abs(wind) / self.WIND_CHILL)
+        self.warmth += (self.HEAT * sheltered - chill) * dt
+        np.clip(self.warmth, 0.0, 1.0, out=self.warmth)
+
+        # integrate
+        vx += ax * dt
+        vz += az * dt
+        damp = max(0.0, 1.0 - self.DAMPING * dt)
+        vx *= damp
+        vz *= damp
+        speed = np.hypot(vx, vz)
+        fast = speed > self.MAX_SPEED
+        if fast.any():
+            scale = self.MAX_SPEED / speed[fast]
+            vx[fast] *= scale
+            vz[fast] *= scale
+        x += vx * dt
+        z += vz * dt
+
+        # stay on the strip
+        for pos, vel, lo, hi in ((x, vx, self.left, self.right - PENGUIN_W), (z, vz, 0.0, self.depth)):
+            out = (pos < lo) | (pos > hi)
+            if out.any():
+                np.clip(pos, lo, hi, out=pos)
+                vel[out] = 0.0
+
+    def flee(self, hazard_xs):
+        # hazards binned into FLEE_RADIUS columns, each penguin checks its own and
+        # both neighbouring columns and runs away from the hazards' middle
+        cs = self.FLEE_RADIUS
+        x = self.x + PENGUIN_W / 2
+        hc = (hazard_xs // cs).astype(np.int64)
+        pc = (x // cs).astype(np.int64)
+        lo = min(hc.min(), pc.min()) - 1
+        size = max(hc.max(), pc.max()) - lo + 2
+        counts = np.bincount(hc - lo, minlength=size)
+        sums = np.bincount(hc - lo, hazard_xs, minlength=size)
+        ax = np.zeros(len(x))
+        for off in (-1, 0, 1):
+            column = pc - lo + off
+            hazards = counts[column]
+            away = x - sums[column] / np.maximum(hazards, 1)
+            ax += self.FLEE * np.sign(away) * (hazards > 0) * (np.abs(away) < cs * 1.5)
+        return ax
+
+    def screen_positions(self, camera_offset=(0, 0)):
+        """Back-to-front draw order and each penguin's top-left on screen"""
+        order = np.argsort(-self.z, kind="stable")
+        ox, oy = camera_offset
+        sx = self.x[order] + ox
+        sy = self.ground_y - PENGUIN_H - self.z[order] * self.DEPTH_SQUASH + oy
+        return order, sx, sy
+
+
+# =========================
+# REACHABILITY
+# =========================
+
+class JumpEnvelope:
+    # How far the player can get with one jump, for one set of physics values.
+    # A full-height jump (jump held, walking the whole way) is stepped once,
+    # and for every whole px of height difference between takeoff and landing
+    # the envelope keeps how far sideways the player travels before coming
+    # down through that height, walking with the weakest wind and against the
+    # strongest. Checking a gap is then a table lookup, nothing is simulated.
+    # Envelopes are cached per physics values, see for_player().
+    # Ceilings aren't considered, only where the player takes off and lands.
+
+    DROP = 1200  # deepest fall tabulated, anything lower counts as this low
+    MARGIN_Y = 6  # px below the exact apex, nobody lands a pixel-perfect jump
+    MARGIN_X = 0.85  # of the exact reach, likewise
+
+    cache = {}  # physics values -> JumpEnvelope
+    default_envelope = None
+
+    def __init__(self, gravity, jump_force, fall_gravity_multiplier, max_fall_speed, move_speed, wind,
+                 size=(32, 48), timestep=1 / 60):
+        wind_low, wind_high = wind  # px/s^2 pushing right, weakest and strongest
+        self.width, self.height = size
+        # one tick at a time, integrated like move_swept does
+        y = 0.0
+        vy = jump_force
+        right = left = wind_right = wind_left = 0.0
+        ys, rights, lefts = [], [], []
+        while y < self.DROP:
+            vy = min(vy + gravity * (fall_gravity_multiplier if vy > 0 else 1) * timestep, max_fall_speed)
+            y += vy * timestep
+            wind_right += wind_low * timestep
+            wind_left += wind_high * timestep
+            right += (move_speed + wind_right) * timestep
+            left += (move_speed - wind_left) * timestep
+            ys.append(y)
+            rights.append(right)
+            lefts.append(left)
+
+        apex = int(np.argmin(ys))
+        self.rise = max(0, int(-ys[apex]) - self.MARGIN_Y)  # highest landing above takeoff
+        # landing dy px lower (negative is higher) happens in the first falling
+        # tick that gets down to dy, reach is how far it got by the tick before
+        falling = np.array(ys[apex:])
+        heights = np.arange(-self.rise, self.DROP + 1)
+        tick = np.minimum(np.searchsorted(falling, heights) + apex, len(ys) - 1)
+        before = np.maximum(tick - 1, 0)
+        self.right = (np.maximum(np.array(rights)[before], 0) * self.MARGIN_X).astype(int).tolist()
+        self.left = (np.maximum(np.array(lefts)[before], 0) * self.MARGIN_X).astype(int).tolist()
+        self.longest = max(max(self.right), max(self.left))
+
+    @classmethod
+    def for_player(cls, player, wind_force=None, gustiness=1.0, timestep=None):
+        """The (cached) envelope for player's physics values and a WeatherSystem's wind"""
+        if wind_force is None:
+            wind_force = WIND_FORCE
+        wind = (wind_force * (1 - gustiness), wind_force * (1 + gustiness))
+        key = (player.gravity, player.jump_force, player.fall_gravity_multiplier, player.max_fall_speed,
+               player.move_speed, tuple(sorted(wind)), tuple(player.rect.size), timestep or FIXED_DT)
+        envelope = cls.cache.get(key)
+        if envelope is None:
+            envelope = cls.cache[key] = cls(*key)
+        return envelope
+
+    @classmethod
+    def default(cls):
+        """Envelope for a fresh Player with the game's usual wind"""
+        if cls.default_envelope is None:
+            player = Player(pygame.Surface(SPRITES["player"][1]), None)
+            setup_player_gravity(player)
+            cls.default_envelope = cls.for_player(player)
+        return cls.default_envelope
+
+    def reaches(self, src, dst):
+        """Can the player get from standing on rect src to standing on rect dst in one jump (or a drop)"""
+        dy = dst.top - src.top
+        if dy < -self.rise:
+            return False
+        dy = min(dy, self.DROP)
+        w = self.width
+        # player x standing on src is src.left - w + 1 .. src.right - 1, on dst likewise
+        # going right: take off as far right as possible, but not underneath
+        # dst if it's higher, then get over dst's left end within reach
+        takeoff = src.right - 1 if dy >= 0 else min(src.right - 1, dst.left - w)
+        if (src.left - w < takeoff and dst.right > src.left - w + 1
+                and dst.left - w + 1 - takeoff <= self.right[dy + self.rise]):
+            return True
+        # going left, the same mirrored
+        takeoff = src.left - w + 1 if dy >= 0 else max(src.left - w + 1, dst.right)
+        return (takeoff < src.right and dst.left - w + 1 < src.right
+                and takeoff - dst.right + 1 <= self.left[dy + self.rise])
+
+    def place(self, src, rect):
+        """rect moved as little as it takes (down, then sideways) to be reachable from src, going right"""
+        rect = rect.copy()
+        rect.top = max(rect.top, src.top - self.rise)
+        dy = min(rect.top - src.top, self.DROP)
+        # not left of src, and if it's higher not overhanging where the jump starts
+        rect.left = max(rect.left, src.right if dy < 0 else src.left)
+        rect.left = min(rect.left, src.right - 1 + self.width - 1 + self.right[dy + self.rise])
+        return rect
+
+
+class PlatformIndex:
+    # Interval index over platform rects, kept sorted by left edge, so the
+    # rects a jump from (or to) some span could involve are a bisect away.
+
+    def __init__(self, envelope, rects=()):
+        self.envelope = envelope
+        self.lefts = []
+        self.rects = []
+        self.widest = 0
+        for rect in rects:
+            self.add(rect)
+
+    def __len__(self):
+        return len(self.rects)
+
+    def add(self, rect):
+        i = bisect.bisect_right(self.lefts, rect.left)
+        self.lefts.insert(i, rect.left)
+        self.rects.insert(i, rect)
+        self.widest = max(self.widest, rect.width)
+
+    def near(self, rect):
+        """Rects close enough sideways to rect for a jump between them"""
+        reach = self.envelope.longest + self.envelope.width
+        lo = bisect.bisect_left(self.lefts, rect.left - reach - self.widest)
+        hi = bisect.bisect_right(self.lefts, rect.right + reach)
+        return self.rects[lo:hi]
+
+    def reachable(self, rect):
+        """Can rect be jumped to from any rect in the index"""
+        reaches = self.envelope.reaches
+        return any(reaches(src, rect) for src in self.near(rect))
+
+
+def reachable_goal(goal, platforms, envelope=None):
+    """
+    goal (a Rect) if a jump from one of the platforms touches it, otherwise
+    goal moved over to the highest platform below it, about as high as it can be.
+    Touching it is all that counts, so it just has to come within a player's height.
+    """
+    envelope = envelope or JumpEnvelope.default()
+    reach = envelope.height + goal.height - 1
+    feet = pygame.Rect(goal.left, goal.top + reach, goal.width, 1)  # lowest feet touching it from below
+    rects = [p.rect for p in platforms]
+    if PlatformIndex(envelope, rects).reachable(feet):
+        return goal
+    below = [r for r in rects if r.top > feet.top] or rects
+    feet = envelope.place(min(below, key=lambda r: r.top), feet)
+    return pygame.Rect(feet.left, feet.top - reach, goal.width, goal.height)
+
+
+def unreachable_platforms(platforms, entry, envelope=None):
+    """The platforms that can't be got to from entry (a Rect) however you jump, for checking whole levels"""
+    envelope = envelope or JumpEnvelope.default()
+    index = PlatformIndex(envelope, [p.rect for p in platforms])
+    owners = {id(p.rect): p for p in platforms}
+    reached = set()
+    todo = [entry]
+    while todo:
+        src = todo.pop()
+        for rect in index.near(src):
+            if id(rect) not in reached and envelope.reaches(src, rect):
+                reached.add(id(rect))
+                todo.append(rect)
+    return [owners[id(rect)] for rect in index.rects if id(rect) not in reached]
+
+
+# ==========
+# FUNCTIONS
+# ==========
+
+
+
+
+def ice_physics(player, platform):
+    # Reduced friction, sliding mechanics
+    player.velocity.x *= 0.95
+
+def check_base_collisions(player, terrain):
+    # baseplate collisions (feet, head, sides)
+    # Slope handling for mountain angles
+    # Climbing surface contact
+    
+    if player.rect.colliderect(terrain.rect):
+        player.position.y = terrain.rect.top - player.rect.height  # Move above terrain
+        player.rect.bottom = terrain.rect.top  # Align with terrain
+        player.velocity.y = 0  # Stop falling
+        player.is_grounded = True
+        
+
+
+def check_hazards(player, hazards):
+    # Crevasse detection
+    # Falling object collisions
+    # Avalanche zone detection
+    
+    if player.rect.colliderect(hazards.rect):
+        return True
+
+
+def generate_mountain_section(surfacelist, rng=random, origin=(0, 0), entry=None, envelope=None):
+    # Procedural or hand-crafted level sections
+    # Mix of platforms, climbs, hazards
+    # rng: anything with randint/choice (a seeded random.Random for repeatable levels)
+    # origin: offset of the whole section, see LevelStreamer
+    # entry: Rect the player comes in from, the last section's top platform if None
+    # envelope: JumpEnvelope every platform has to be reachable with, the default player's if None.
+    #   A platform nothing reaches is rerolled a few times, then moved down and
+    #   sideways until the platform before it does.
+    platforms_list = []
+    ox, oy = origin
+    envelope = envelope or JumpEnvelope.default()
+    if entry is None:
+        entry = SECTION_ENTRY.move(ox, oy)
+    reachable = PlatformIndex(envelope, [entry])
+    prev = entry
+    multx1 = 75
+    multx2 = 100
+    multy1 = 425
+    multy2 = 450
+    for fac in range(SECTION_PLATFORMS):
+        x = rng.randint(multx1,multx2)
+        y = rng.randint(multy1,multy2)
+        w = rng.randint(80,200)
+        h = rng.randint(15,50)
+        surf = rng.choice(surfacelist)
+        rect = pygame.Rect(x + ox, y + oy, w, h)
+        for _ in range(SECTION_REROLLS):
+            if reachable.reachable(rect):
+                break
+            rect.topleft = (rng.randint(multx1, multx2) + ox, rng.randint(multy1, multy2) + oy)
+        else:
+            if not reachable.reachable(rect):
+                rect = envelope.place(prev, rect)
+        multx1 += SECTION_STEP_X
+        multx2 += SECTION_STEP_X
+        multy1 += SECTION_STEP_Y
+        multy2 += SECTION_STEP_Y
+        platforms_list.append(Platform(*rect, surf))
+        reachable.add(rect)
+        prev = rect
+
+    return platforms_list
+
+
+# =========================
+# LEVEL STREAMING
+# =========================
+
+# Shape of one generated section: each platform steps right and up,
+# so the next section starts where the last one left off
+SECTION_PLATFORMS = 12
+SECTION_STEP_X = 200
+SECTION_STEP_Y = -50
+SECTION_WIDTH = SECTION_PLATFORMS * SECTION_STEP_X
+SECTION_RISE = SECTION_PLATFORMS * SECTION_STEP_Y
+SECTION_REROLLS = 3  # new positions tried for an unreachable platform before it's moved
+BASE_TERRAIN = pygame.Rect(0, 580, 300, 300)  # the ground at the foot of the mountain
+# The last section's top platform, relative to this section: as far left,
+# as low and as narrow as generate_mountain_section ever rolls it
+SECTION_ENTRY = pygame.Rect(75 + SECTION_STEP_X * (SECTION_PLATFORMS - 1) - SECTION_WIDTH,
+                            450 + SECTION_STEP_Y * (SECTION_PLATFORMS - 1) - SECTION_RISE, 80, 15)
+
+
+class MountainSection:
+    # One generated chunk of the mountain (or one cell of a LevelFile)
+
+    def __init__(self, index, platforms, spawners=()):
+        self.index = index
+        self.platforms = platforms
+        self.spawners = list(spawners)
+
+
+class LevelStreamer:
+    # Endless mountain made of generate_mountain_section chunks.
+    # Section i is always generated from its own Random(seed, i), so a seed
+    # gives the same mountain no matter what order sections are built in.
+    # Sections ahead of the player are built on a worker thread, and only a
+    # fixed window around the player is kept alive.
+
+    def __init__(self, seed=0, surfacelist=("ice", "rock"), ahead=3, behind=1, threaded=True):
+        self.seed = seed
+        self.goal = None  # endless, no goal, just climb until the avalanche gets you
+        self.surfacelist = list(surfacelist)
+        self.ahead = ahead
+        self.behind = behind
+        self.live = {}  # index -> MountainSection
+        self.pending = set()
+        self.envelope = JumpEnvelope.default()  # every platform has to be reachable with this
+
+        self.threaded = threaded
+        self.requests = queue.Queue()
+        self.results = queue.Queue()
+        self.worker = None
+        if threaded:
+            self.worker = threading.Thread(target=self._work, name="LevelStreamer", daemon=True)
+            self.worker.start()
+
+    def build_section(self, index):
+        rng = random.Random(f"{self.seed}:{index}")
+        origin = (index * SECTION_WIDTH, index * SECTION_RISE)
+        entry = BASE_TERRAIN if index == 0 else None
+        return MountainSection(index, generate_mountain_section(self.surfacelist, rng, origin, entry, self.envelope))
+
+    def _work(self):
+        while True:
+            index = self.requests.get()
+            if index is None:
+                return
+            self.results.put(self.build_section(index))
+
+    def close(self):
+        if self.worker is not None:
+            self.requests.put(None)
+            self.worker.join()
+            self.worker = None
+
+    def reset(self):
+        # drain anything in flight so old sections don't come back
+        while self.pending:
+            self.pending.discard(self.results.get().index)
+        self.live.clear()
+
+    @staticmethod
+    def section_index_at(x):
+        return max(0, int(x // SECTION_WIDTH))
+
+    def update(self, focus_x, focus_y=None):
+        """
+        Move the live window to focus_x (sections only go sideways, focus_y is ignored).
+        Returns (added, removed) lists of MountainSection.
+        """
+        centre = self.section_index_at(focus_x)
+        first = max(0, centre - self.behind)
+        last = centre + self.ahead
+        added = []
+        removed = []
+
+        # pick up whatever the worker finished
+        while self.pending:
+            try:
+                section = self.results.get_nowait()
+            except queue.Empty:
+                break
+            self.pending.discard(section.index)
+            if first <= section.index <= last and section.index not in self.live:
+                self.live[section.index] = section
+                added.append(section)
+
+        # the player's section and its neighbours are needed right now,
+        # don't wait for the worker for those
+        for index in range(max(0, centre - 1), centre + 2):
+            if index not in self.live and index not in self.pending:
+                section = self.live[index] = self.build_section(index)
+                added.append(section)
+            elif index in self.pending:
+                while index not in self.live:
+                    section = self.results.get()
+                    self.pending.discard(section.index)
+                    if first <= section.index <= last and section.index not in self.live:
+                        self.live[section.index] = section
+                        added.append(section)
+
+        for index in range(first, last + 1):
+            if index not in self.live and index not in self.pending:
+                if self.threaded:
+                    self.pending.add(index)
+                    self.requests.put(index)
+                else:
+                    section = self.live[index] = self.build_section(index)
+                    added.append(section)
+
+        for index in [i for i in self.live if not first <= i <= last]:
+            removed.append(self.live.pop(index))
+
+        return added, removed
+
+    def platforms(self):
+        return [p for index in sorted(self.live) for p in self.live[index].platforms]
+
+    def spawners(self):
+        return [s for index in sorted(self.live) for s in self.live[index].spawners]
+
+
+# =========================
+# LEVEL FILES
+# =========================
+# Versioned binary levels, all little-endian:
+#   header     LEVEL_HEADER
+#   sections   LEVEL_SECTION records, sorted by key
+#   platforms  LEVEL_PLATFORM records, grouped by section
+#   spawners   LEVEL_SPAWNER records, grouped by section
+# The world is cut into cell_w x cell_h section cells, and each platform
+# or spawner belongs to the cell its top-left corner is in.
+
+LEVEL_MAGIC = b"SMLV"
+LEVEL_VERSION = 1
+# magic, version, flags, cell w, cell h, sections, platforms, spawners, has goal, goal x, y, w, h
+LEVEL_HEADER = struct.Struct("<4sHHiiIII?3xiiii")
+LEVEL_SECTION = np.dtype([("key", "<i8"), ("first_platform", "<u4"), ("platforms", "<u4"),
+                          ("first_spawner", "<u4"), ("spawners", "<u4")])
+LEVEL_PLATFORM = np.dtype([("x", "<i4"), ("y", "<i4"), ("w", "<u2"), ("h", "<u2"), ("surface", "u1"), ("pad", "V3")])
+LEVEL_SPAWNER = np.dtype([("x", "<i4"), ("y", "<i4"), ("interval", "<f4"), ("type", "u1"), ("pad", "V3")])
+LEVEL_SURFACES = ["rock", "ice"]
+LEVEL_CELL = (1024, 1024)
+
+
+def section_key(sx, sy):
+    # one int64 per section cell that sorts by column, then row
+    return sx * (1 << 32) + (sy + (1 << 31))
+
+
+class HazardSpawner:
+    # Drops a hazard from (x, y) every interval seconds, for hand-built levels
+
+    __slots__ = ("x", "y", "obst_type", "interval")
+
+    def __init__(self, x, y, obst_type="icicle", interval=2.0):
+        self.x = x
+        self.y = y
+        self.obst_type = obst_type
+        self.interval = interval
+
+
+def write_level(path, platforms, spawners=(), goal=None, cell=LEVEL_CELL):
+    """Save platforms, HazardSpawners and the goal Platform as a level file"""
+    cell_w, cell_h = cell
+    plats = np.zeros(len(platforms), LEVEL_PLATFORM)
+    for i, name in enumerate(("x", "y", "w", "h")):
+        plats[name] = [p.rect[i] for p in platforms]
+    plats["surface"] = [LEVEL_SURFACES.index(p.surface) for p in platforms]
+    spawns = np.zeros(len(spawners), LEVEL_SPAWNER)
+    spawns["x"] = [s.x for s in spawners]
+    spawns["y"] = [s.y for s in spawners]
+    spawns["interval"] = [s.interval for s in spawners]
+    spawns["type"] = [HAZARD_KINDS[s.obst_type][0] for s in spawners]
+
+    # group both tables by section cell, keeping each one's original order within a cell
+    plat_keys = section_key(plats["x"].astype(np.int64) // cell_w, plats["y"].astype(np.int64) // cell_h)
+    spawn_keys = section_key(spawns["x"].astype(np.int64) // cell_w, spawns["y"].astype(np.int64) // cell_h)
+    order = np.argsort(plat_keys, kind="stable")
+    plats, plat_keys = plats[order], plat_keys[order]
+    order = np.argsort(spawn_keys, kind="stable")
+    spawns, spawn_keys = spawns[order], spawn_keys[order]
+
+    keys = np.union1d(plat_keys, spawn_keys)
+    sections = np.zeros(len(keys), LEVEL_SECTION)
+    sections["key"] = keys
+    sections["first_platform"] = np.searchsorted(plat_keys, keys, "left")
+    sections["platforms"] = np.searchsorted(plat_keys, keys, "right") - sections["first_platform"]
+    sections["first_spawner"] = np.searchsorted(spawn_keys, keys, "left")
+    sections["spawners"] = np.searchsorted(spawn_keys, keys, "right") - sections["first_spawner"]
+
+    goal_rect = tuple(goal.rect) if goal is not None else (0, 0, 0, 0)
+    with open(path, "wb") as f:
+        f.write(LEVEL_HEADER.pack(LEVEL_MAGIC, LEVEL_VERSION, 0, cell_w, cell_h, len(sections), len(plats),
+                                  len(spawns), goal is not None, *goal_rect))
+        f.write(sections.tobytes())
+        f.write(plats.tobytes())
+        f.write(spawns.tobytes())
+
+
+def export_generated_level(path, seed=0, sections=100, surfacelist=("ice", "rock")):
+    """Converter: save sections 0..sections-1 of the endless mountain for seed as a level file"""
+    streamer = LevelStreamer(seed, surfacelist, threaded=False)
+    platforms = [p for index in range(sections) for p in streamer.build_section(index).platforms]
+    top = platforms[-1].rect
+    # one jump above the last platform
+    goal = Platform(*reachable_goal(pygame.Rect(top.x, top.y - 100, 100, 20), platforms[-1:]), "rock")
+    write_level(path, platforms, goal=goal)
+    return len(platforms)
+
+
+class LevelFile:
+    # A level file opened with mmap. Opening reads just the header and maps
+    # the record tables without copying them. Platform objects are only made
+    # for the sections that get asked for, so a huge mountain costs memory
+    # for the part being played, not the whole thing.
+
+    def __init__(self, path):
+        with open(path, "rb") as f:
+            self.map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        (magic, version, _, self.cell_w, self.cell_h, n_sections, n_platforms, n_spawners,
+         has_goal, *goal_rect) = LEVEL_HEADER.unpack_from(self.map)
+        if magic != LEVEL_MAGIC or version != LEVEL_VERSION:
+            self.map.close()
+            raise ValueError(f"{path} is not a version {LEVEL_VERSION} level file")
+
+        offset = LEVEL_HEADER.size
+        self.sections = np.frombuffer(self.map, LEVEL_SECTION, n_sections, offset)
+        offset += self.sections.nbytes
+        self.platform_records = np.frombuffer(self.map, LEVEL_PLATFORM, n_platforms, offset)
+        offset += self.platform_records.nbytes
+        self.spawner_records = np.frombuffer(self.map, LEVEL_SPAWNER, n_spawners, offset)
+        self.keys = self.sections["key"]  # a view, still in the file
+        self.goal = Platform(*goal_rect, "rock") if has_goal else None
+
+    def __len__(self):
+        return len(self.sections)
+
+    def cell_at(self, x, y):
+        return int(x // self.cell_w), int(y // self.cell_h)
+
+    def section(self, sx, sy):
+        """MountainSection for cell (sx, sy), None if there's nothing there"""
+        key = section_key(sx, sy)
+        i = int(np.searchsorted(self.keys, key))
+        if i == len(self.keys) or self.keys[i] != key:
+            return None
+        record = self.sections[i]
+
+        first = int(record["first_platform"])
+        rows = self.platform_records[first:first + int(record["platforms"])]
+        platforms = [Platform(x, y, w, h, LEVEL_SURFACES[surface]) for x, y, w, h, surface in
+                     zip(rows["x"].tolist(), rows["y"].tolist(), rows["w"].tolist(), rows["h"].tolist(),
+                         rows["surface"].tolist())]
+
+        first = int(record["first_spawner"])
+        rows = self.spawner_records[first:first + int(record["spawners"])]
+        spawners = [HazardSpawner(x, y, HAZARD_NAMES[kind], interval) for x, y, interval, kind in
+                    zip(rows["x"].tolist(), rows["y"].tolist(), rows["interval"].tolist(), rows["type"].tolist())]
+        return MountainSection((sx, sy), platforms, spawners)
+
+    def close(self):
+        # the numpy views have to go before the map can close
+        self.sections = self.platform_records = self.spawner_records = self.keys = None
+        self.map.close()
+
+
+class LevelFileStreamer:
+    # LevelStreamer's interface for a LevelFile: keeps the section cells
+    # within radius cells of the player alive in both directions.
+    # Loading a cell is a lookup and a slice of the map, so no worker thread.
+
+    def __init__(self, level, radius=1):
+        self.level = level
+        self.seed = None  # not generated
+        self.goal = level.goal
+        self.radius = radius
+        self.live = {}  # (sx, sy) -> MountainSection
+
+    def update(self, focus_x, focus_y=0.0):
+        """
+        Move the live window to (focus_x, focus_y).
+        Returns (added, removed) lists of MountainSection.
+        """
+        cx, cy = self.level.cell_at(focus_x, focus_y)
+        r = self.radius
+        wanted = {(sx, sy) for sx in range(cx - r, cx + r + 1) for sy in range(cy - r, cy + r + 1)}
+        added = []
+        removed = []
+        for index in sorted(wanted - self.live.keys()):
+            section = self.level.section(*index) or MountainSection(index, [])  # remember empty cells too
+            self.live[index] = section
+            if section.platforms or section.spawners:
+                added.append(section)
+        for index in [i for i in self.live if i not in wanted]:
+            section = self.live.pop(index)
+            if section.platforms or section.spawners:
+                removed.append(section)
+        return added, removed
+
+    def platforms(self):
+        return [p for index in sorted(self.live) for p in self.live[index].platforms]
+
+    def spawners(self):
+        return [s for index in sorted(self.live) for s in self.live[index].spawners]
+
+    def reset(self):
+        self.live.clear()
+
+    def close(self):
+        self.level.close()
+
+
+class Camera:
+    # Smooth camera tracking
+    # offset is what gets added to world coords to put them on screen,
+    # so it goes negative as the view scrolls right and positive as it climbs.
+    # Never shows left of the level start or below the ground.
+
+    def __init__(self, view_size=(800, 600), smoothing=6.0, left=0, bottom=600):
+        self.view_w, self.view_h = view_size
+        self.smoothing = smoothing  # 1/s, higher follows tighter
+        self.left = left  # world x the view stays right of, None for no limit
+        self.bottom = bottom  # world y the view stays above, None for no limit
+        self.x = 0.0  # world coords of the view's top-left
+        self.y = 0.0
+
+    def target(self, focus_x, focus_y):
+        """Top-left of a view centred on focus, kept in bounds"""
+        x = focus_x - self.view_w / 2
+        y = focus_y - self.view_h / 2
+        if self.left is not None:
+            x = max(x, self.left)
+        if self.bottom is not None:
+            y = min(y, self.bottom - self.view_h)
+        return x, y
+
+    def snap(self, focus_x, focus_y):
+        self.x, self.y = self.target(focus_x, focus_y)
+
+    def follow(self, focus_x, focus_y, dt):
+        """Ease towards focus, the same speed whatever the frame rate"""
+        x, y = self.target(focus_x, focus_y)
+        t = 1.0 - math.exp(-self.smoothing * dt)
+        self.x += (x - self.x) * t
+        self.y += (y - self.y) * t
+
+    @property
+    def offset(self):
+        return (-self.x, -self.y)
+
+# =========================
+# TEXT & HUD
+# =========================
+
+class TextCache:
+    # Shared Font objects plus an LRU cache of rendered text surfaces
+    # keyed by (size, text, color), so unchanged text is never rasterized twice
+
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+
+    def font(self, size):
+        font = self.fonts.get(size)
+        if font is None:
+            if not pygame.font.get_init():
+                pygame.font.init()
+            font = self.fonts[size] = pygame.font.Font(None, size)
+        return font
+
+    def render(self, text, size, color):
+        key = (size, text, color)
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            return surface
+
+        surface = self.font(size).render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_entries:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        self.surfaces.clear()
+
+
+text_cache = TextCache()
+
+
+def draw_health_bar(screen, player, pos=(10, 10), cache=text_cache, scale=1):
+    # Draw player health bar
+    bar_width = round(200 * scale)
+    bar_height = round(20 * scale)
+    bar_x, bar_y = pos
+    
+    # Background
+    pygame.draw.rect(screen, (50, 50, 50), (bar_x, bar_y, bar_width, bar_height))
+    
+    # Health fill
+    health_width = max(0, player.health / player.max_health) * bar_width
+    health_color = (0, 255, 0) if player.health > 50 else (255, 255, 0) if player.health > 25 else (255, 0, 0)
+    pygame.draw.rect(screen, health_color, (bar_x, bar_y, health_width, bar_height))
+    
+    # Border
+    pygame.draw.rect(screen, (255, 255, 255), (bar_x, bar_y, bar_width, bar_height), max(1, round(2 * scale)))
+    
+    # Health text
+    health_text = cache.render(f"Health: {player.health}/{player.max_health}", round(24 * scale), (255, 255, 255))
+    screen.blit(health_text, (bar_x + 5 * scale, bar_y + 2 * scale))
+
+def timer_text(hazard_manager, cache=text_cache, scale=1):
+    # Avalanche timer label
+    size = round(36 * scale)
+    if hazard_manager.avalanche_active:
+        return cache.render("AVALANCHE!", size, (255, 50, 50))
+    elif hazard_manager.avalanche_warning:
+        return cache.render(f"Avalanche: {int(hazard_manager.avalanche_timer)}s", size, (255, 150, 50))
+    else:
+        return cache.render(f"Avalanche: {int(hazard_manager.avalanche_timer)}s", size, (255, 255, 255))
+
+
+class Hud:
+    # Health bar, avalanche timer and warning
+    # Each part remembers the value it last showed and only re-renders
+    # when that value changes, otherwise it just blits what it already has
+    # Laid out for an 800x600 screen, scale and origin move that layout onto
+    # a bigger window with the text rendered at the window's resolution.
+
+    HEALTH_POS = (10, 10)
+    TIMER_POS = (600, 10)
+    WARNING_POS = (200, 50)
+
+    def __init__(self, cache=text_cache, scale=1, origin=(0, 0)):
+        self.cache = cache
+        self.scale = scale
+        self.health_pos, self.timer_pos, self.warning_pos = (
+            (origin[0] + x * scale, origin[1] + y * scale) for x, y in (self.HEALTH_POS, self.TIMER_POS,
+                                                                        self.WARNING_POS))
+        self.health_shown = None
+        self.health_panel = pygame.Surface((round(200 * scale), round(20 * scale)))
+        self.timer_shown = None
+        self.timer_surface = None
+        self.warning_shown = None
+        self.warning_surface = None
+
+    def draw(self, screen, player, hazard_manager):
+        """Draw the HUD, returns the screen rects it covered"""
+        drawn = []
+
+        # Health bar is cached whole, it only changes when we get hit
+        if player.health != self.health_shown:
+            self.health_shown = player.health
+            draw_health_bar(self.health_panel, player, (0, 0), self.cache, self.scale)
+        drawn.append(screen.blit(self.health_panel, self.health_pos))
+
+        timer_key = (hazard_manager.avalanche_active, hazard_manager.avalanche_warning,
+                     int(hazard_manager.avalanche_timer))
+        if timer_key != self.timer_shown:
+            self.timer_shown = timer_key
+            self.timer_surface = timer_text(hazard_manager, self.cache, self.scale)
+        drawn.append(screen.blit(self.timer_surface, self.timer_pos))
+
+        if hazard_manager.avalanche_warning and not hazard_manager.avalanche_active:
+            if int(pygame.time.get_ticks() / 500) % 2 == 0:
+                seconds = int(hazard_manager.avalanche_timer)
+                if seconds != self.warning_shown:
+                    self.warning_shown = seconds
+                    self.warning_surface = self.cache.render(f"AVALANCHE IN {seconds}s!", round(48 * self.scale),
+                                                             (255, 50, 50))
+                drawn.append(screen.blit(self.warning_surface, self.warning_pos))
+
+        return drawn
+
+
+# =========================
+# PROFILING
+# =========================
+
+class LapTimer:
+    # Splits a frame into named phases: start(), then lap(name) after each phase.
+    # The sim and renderers only call it when one is attached (their .timer),
+    # so with no timer the hooks cost an attribute check.
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        self.last = 0.0
+        self.frame = {}  # phase -> seconds so far this frame
+
+    def start(self):
+        self.last = self.clock()
+
+    def lap(self, name):
+        now = self.clock()
+        self.frame[name] = self.frame.get(name, 0.0) + (now - self.last)
+        self.last = now
+
+    def end_frame(self):
+        """Return this frame's {phase: seconds} and start a new frame"""
+        frame = self.frame
+        self.frame = {}
+        return frame
+
+
+class ProfilerTrack(LapTimer):
+    # LapTimer that also records every lap as a Chrome trace event
+
+    def __init__(self, profiler, name, tid):
+        super().__init__(profiler.clock)
+        self.profiler = profiler
+        self.name = name
+        self.tid = tid
+
+    def lap(self, name):
+        start = self.last
+        super().lap(name)
+        events = self.profiler.events
+        if events is not None and len(events) < self.profiler.max_events:
+            origin = self.profiler.origin
+            events.append({"name": name, "cat": self.name, "ph": "X", "pid": 0, "tid": self.tid,
+                           "ts": (start - origin) * 1e6, "dur": (self.last - start) * 1e6})
+
+
+class Profiler:
+    # Per-phase timings for the whole main loop.
+    # Three tracks: "frame" (input, sim, render, present) timed by the main loop,
+    # and "update"/"draw" hooked into the sim and renderer as their .timer.
+    # Keeps a rolling history for the overlay, and optionally trace events.
+
+    def __init__(self, history=240, trace=False, max_events=2_000_000, clock=time.perf_counter):
+        self.clock = clock
+        self.origin = clock()
+        self.events = [] if trace else None
+        self.max_events = max_events
+        self.frame = ProfilerTrack(self, "frame", 1)
+        self.update = ProfilerTrack(self, "update", 2)
+        self.draw = ProfilerTrack(self, "draw", 3)
+        self.history = deque(maxlen=history)  # one {track/phase: seconds} per frame
+
+    def attach(self, sim=None, renderer=None):
+        if sim is not None:
+            sim.timer = self.update
+        if renderer is not None:
+            renderer.timer = self.draw
+
+    @staticmethod
+    def detach(sim=None, renderer=None):
+        if sim is not None:
+            sim.timer = None
+        if renderer is not None:
+            renderer.timer = None
+
+    def end_frame(self):
+        frame = {}
+        for track in (self.frame, self.update, self.draw):
+            for phase, seconds in track.end_frame().items():
+                frame[f"{track.name}/{phase}"] = seconds
+        self.history.append(frame)
+        return frame
+
+    def averages(self):
+        """Mean seconds per frame for every phase over the history"""
+        totals = {}
+        for frame in self.history:
+            for phase, seconds in frame.items():
+                totals[phase] = totals.get(phase, 0.0) + seconds
+        n = max(1, len(self.history))
+        return {phase: total / n for phase, total in totals.items()}
+
+    def export_chrome_trace(self, path):
+        """Write the recorded events as Chrome trace JSON (chrome://tracing, Perfetto)"""
+        import json
+
+        # name the tracks so they show up as "frame", "update", "draw"
+        names = [{"name": "thread_name", "ph": "M", "pid": 0, "tid": track.tid, "args": {"name": track.name}}
+                 for track in (self.frame, self.update, self.draw)]
+        with open(path, "w") as f:
+            json.dump({"traceEvents": names + (self.events or []), "displayTimeUnit": "ms"}, f)
+
+
+class ProfilerOverlay:
+    # Rolling frame-time graph, slowest phases and entity counts, drawn over the game.
+    # Has its own small text cache since its numbers change all the time,
+    # and only refreshes the text a few times a second.
+
+    POS = (5, 410)
+    GRAPH_RECT = pygame.Rect(5, 5, 240, 80)  # inside the panel
+    COLORS = {"update": (80, 200, 255), "draw": (255, 170, 60), "frame": (180, 180, 180)}
+    TARGET_MS = 1000.0 / 60.0
+    TEXT_EVERY = 15  # frames
+
+    def __init__(self):
+        self.cache = TextCache(64)
+        self.panel = pygame.Surface((250, 185), pygame.SRCALPHA)
+        self.lines = []
+        self.frames = 0
+
+    def draw(self, screen, profiler, sim, renderer):
+        """Draw the overlay, returns the screen rect it covered"""
+        panel = self.panel
+        panel.fill((0, 0, 0, 170))
+        graph = self.GRAPH_RECT
+
+        # one column per frame: sim, render, then input + present on top,
+        # scaled so two 60 Hz frames fill the graph
+        scale = graph.height / (2 * self.TARGET_MS)
+        history = list(profiler.history)[-graph.width:]
+        for x, frame in enumerate(history, start=graph.left + graph.width - len(history)):
+            y = graph.bottom
+            for track in ("update", "draw", "frame"):
+                if track == "frame":
+                    ms = (frame.get("frame/input", 0.0) + frame.get("frame/present", 0.0)) * 1e3
+                else:
+                    ms = sum(s for k, s in frame.items() if k.startswith(track)) * 1e3
+                h = min(y - graph.top, ms * scale)
+                if h > 0:
+                    pygame.draw.line(panel, self.COLORS[track], (x, y), (x, y - h))
+                    y -= h
+        target_y = graph.bottom - self.TARGET_MS * scale
+        pygame.draw.line(panel, (255, 60, 60), (graph.left, target_y), (graph.right, target_y))
+
+        if self.frames % self.TEXT_EVERY == 0:
+            self.lines = self.text_lines(profiler, sim, renderer)
+        self.frames += 1
+        for i, line in enumerate(self.lines):
+            panel.blit(self.cache.render(line, 18, (255, 255, 255)), (6, graph.bottom + 5 + i * 13))
+
+        return screen.blit(panel, self.POS)
+
+    def text_lines(self, profiler, sim, renderer):
+        averages = profiler.averages()
+        frame_ms = sum(v for k, v in averages.items() if k.startswith("frame/")) * 1e3
+        slowest = sorted(((v, k) for k, v in averages.items() if not k.startswith("frame/")), reverse=True)
+        lines = [f"frame {frame_ms:.2f} ms (avg of {len(profiler.history)})"]
+        lines += [f"{k}  {v * 1e3:.3f} ms" for v, k in slowest[:4]]
+        lines.append(f"hazards {sim.hazard_manager.pool.count}   platforms {len(sim.plats)}")
+        snow = renderer.snow.count if renderer.snow is not None else 0
+        lines.append(f"chunks {len(renderer.terrain_chunks.chunks)}   texts {len(text_cache.surfaces)}   snow {snow}")
+        return lines
+
+
+# =========================
+# SIMULATION
+# =========================
+
+FIXED_DT = 1.0 / 60.0       # physics always steps at 60 Hz, whatever the frame rate
+MAX_FRAME_TIME = 0.25       # clamp long frames so we don't spiral trying to catch up
+WIND_FORCE = 40.0           # 0 = no wind, can tweak the wind however
+
+
+class PlayerInput:
+    # One tick worth of player input
+    # jump_pressed is an edge (this tick only), the rest are held states
+
+    def __init__(self, jump_pressed=False, jump_held=False, left=False, right=False):
+        self.jump_pressed = jump_pressed
+        self.jump_held = jump_held
+        self.left = left
+        self.right = right
+
+
+NO_INPUT = PlayerInput()
+
+
+def read_player_input(keys, jump_pressed):
+    """Build a PlayerInput from pygame.key.get_pressed() and this frame's KEYDOWN"""
+    return PlayerInput(
+        jump_pressed=jump_pressed,
+        jump_held=bool(keys[pygame.K_SPACE]),
+        left=bool(keys[pygame.K_LEFT] or keys[pygame.K_a]),
+        right=bool(keys[pygame.K_RIGHT] or keys[pygame.K_d]),
+    )
+
+
+class RngStreams:
+    # One random.Random per subsystem, all derived from a single seed,
+    # so an extra hazard roll never shifts the level layout and vice versa
+
+    def __init__(self, seed):
+        self.seed = seed
+        self.level = random.Random(f"{seed}:level")
+        self.hazards = random.Random(f"{seed}:hazards")
+        self.weather = random.Random(f"{seed}:weather")
+
+    def getstate(self):
+        return (self.level.getstate(), self.hazards.getstate(), self.weather.getstate())
+
+    def setstate(self, state):
+        level, hazards, weather = state
+        self.level.setstate(level)
+        self.hazards.setstate(hazards)
+        self.weather.setstate(weather)
+
+
+class GameSimulation:
+    # All of the game state and rules, with no window or pygame.display needed.
+    # step() always advances by exactly one fixed timestep so physics doesn't
+    # depend on the frame rate, and it can be run as fast as the CPU allows.
+    # With the same seed and the same inputs every run plays out identically.
+
+    def __init__(self, timestep=FIXED_DT, surfacelist=("ice", "rock"), streamer=None, seed=None, verbose=True):
+        self.timestep = timestep
+        self.verbose = verbose  # print hazard hits and the avalanche starting
+        self.surfacelist = list(surfacelist)
+        self.streamer = streamer  # LevelStreamer for an endless mountain, None for one section
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)
+        self.timer = None  # LapTimer, when someone wants per-phase timings
+        self.recorder = None  # InputRecording, to record every tick's input
+        self.snapshots = None  # SimSnapshots, to rewind
+        self.reset()
+
+    def reset(self):
+        self.rng = RngStreams(self.seed)
+        self.events = TimerWheel(self.timestep)  # everything timed, advanced once per step
+        self.player = Player(assets.get("player"), self.events)
+        setup_player_gravity(self.player)
+        self.terrain = Platform(*BASE_TERRAIN, "rock")
+        self.hazard_manager = HazardManager(self.events, self.rng.hazards, solids=self.solids_near,
+                                            verbose=self.verbose)
+        self.weather = WeatherSystem(self.rng.weather)
+        self.weather.wind_force = WIND_FORCE
+        self.platform_grid = SpatialHash()
+        self.level_version = 0  # bumped whenever plats changes
+        self.cur_platform = None
+        self.spawners = []  # HazardSpawners of the live sections
+
+        if self.streamer is None:
+            self.plats = generate_mountain_section(self.surfacelist, self.rng.level, entry=self.terrain.rect)
+            self.goal = Platform(*reachable_goal(pygame.Rect(350, 200, 100, 20), self.plats), "rock")
+            for p in self.plats:
+                self.platform_grid.insert(p)
+        else:
+            self.goal = self.streamer.goal
+            self.plats = []
+            self.streamer.reset()
+            self.stream_level()
 
-            pygame.display.flip()
-            
+        self.game_won = False
+        self.game_over = False
+        self.ticks = 0
+        self.time = 0.0
+
+        # previous state, for the renderer to interpolate from
+        self.prev_player_pos = pygame.math.Vector2(self.player.position)
+
+        # fixed timestep bookkeeping for advance()
+        self.accumulator = 0.0
+        self.pending_jump = False
+
+        if self.snapshots is not None:
+            self.snapshots.clear()
+
+    @property
+    def finished(self):
+        return self.game_won or self.game_over
+
+    def set_level(self, platforms, goal=None):
+        """Play on a given list of platforms instead of a generated section"""
+        self.plats = list(platforms)
+        self.goal = goal
+        self.cur_platform = None
+        self.platform_grid.clear()
+        for p in self.plats:
+            self.platform_grid.insert(p)
+        self.level_version += 1
+
+    def solids_near(self, rect):
+        """Platforms (and the base terrain) that rect might touch"""
+        found = self.platform_grid.query(rect)
+        if rect.colliderect(self.terrain.rect):
+            found.append(self.terrain)
+        return found
+
+    def stream_level(self):
+        # swap sections in and out around the player
+        added, removed = self.streamer.update(self.player.position.x, self.player.position.y)
+        if not (added or removed):
+            return
+        for section in removed:
+            for p in section.platforms:
+                self.platform_grid.remove(p)
+                if p is self.cur_platform:
+                    self.cur_platform = None
+        for section in sorted(added, key=lambda s: s.index):
+            for p in section.platforms:
+                self.platform_grid.insert(p)
+        self.plats = self.streamer.platforms()
+        self.spawners = self.streamer.spawners()
+        self.hazard_manager.set_spawners(self.spawners)
+        self.level_version += 1
+
+    def step(self, inputs=NO_INPUT):
+        """Advance the game by exactly one timestep"""
+        if self.finished:
+            return
+        if self.recorder is not None:
+            self.recorder.record(self, inputs)
+
+        dt = self.timestep
+        player = self.player
+        self.prev_player_pos.update(player.position)
+        timer = self.timer
+        if timer:
+            timer.start()
+
+        if self.streamer is not None:
+            self.stream_level()
+            if timer:
+                timer.lap("stream")
+
+        if inputs.jump_pressed:
+            player.is_grounded = False
+
+        walk_x = 0.0
+        if inputs.left:
+            walk_x -= player.move_speed
+        if inputs.right:
+            walk_x += player.move_speed
+
+        # collisions (my absolute worst nightmare), swept inside apply_gravity
+        weather = self.weather
+        weather.update_wind(dt)
+        apply_gravity(player, dt, inputs.jump_pressed, inputs.jump_held,
+                      wind_x=weather.wind_at(*player.rect.center), solids=self.solids_near, walk_x=walk_x)
+        if player.is_grounded:
+            self.cur_platform = player.ground
+            # check if on ice
+            player.is_sliding = player.ground.surface == "ice"
+
+        if player.is_sliding:
+            ice_physics(player, self.cur_platform)
+        if timer:
+            timer.lap("movement")
+
+        # hazards
+        hazard_manager = self.hazard_manager
+        hazard_manager.update(dt, player.position.x, player.position.y, weather)
+        # spawns, the avalanche and invincibility running out
+        self.events.advance()
+        if timer:
+            timer.lap("hazards")
+        hit_avalanche = hazard_manager.check_collisions(player)
+        if timer:
+            timer.lap("hazard_collisions")
+        # win/lose
+        if self.goal is not None and player.rect.colliderect(self.goal.rect):
+            self.game_won = True
+
+        if player.health <= 0 or hit_avalanche:
+            self.game_over = True
+        if timer:
+            timer.lap("rules")
+
+        self.ticks += 1
+        self.time += dt
+        if self.snapshots is not None:
+            self.snapshots.capture()
+
+    def state_hash(self):
+        """8-byte digest of the state a replay has to reproduce exactly"""
+        player = self.player
+        hm = self.hazard_manager
+        from hashlib import blake2b
+
+        digest = blake2b(digest_size=8)
+        digest.update(struct.pack(
+            "<qq6d3?", self.ticks, int(player.health),
+            player.position.x, player.position.y, player.velocity.x, player.velocity.y,
+            player.invinc_timer, hm.avalanche_timer,
+            player.is_grounded, self.game_over, self.game_won))
+        pool = hm.pool
+        slots = pool.active_slots()
+        for column in (slots, pool.x[slots], pool.y[slots], pool.fallsp[slots]):
+            digest.update(column.tobytes())
+        if hm.avalanche is not None:
+            digest.update(np.packbits(hm.avalanche.snow).tobytes())
+        return digest.digest()
+
+    def advance(self, frame_time, inputs=NO_INPUT):
+        """
+        Run as many fixed steps as fit in frame_time.
+        Returns how far we are between the last two states (0..1) for rendering.
+        """
+        self.accumulator += min(frame_time, MAX_FRAME_TIME)
+        # a jump press must reach exactly one step, even if this frame runs none
+        self.pending_jump = self.pending_jump or inputs.jump_pressed
+
+        while self.accumulator >= self.timestep:
+            tick_input = inputs
+            if self.pending_jump != inputs.jump_pressed:
+                tick_input = PlayerInput(self.pending_jump, inputs.jump_held, inputs.left, inputs.right)
+            self.step(tick_input)
+            self.pending_jump = False
+            inputs = PlayerInput(False, inputs.jump_held, inputs.left, inputs.right)
+            self.accumulator -= self.timestep
+
+        return self.accumulator / self.timestep
+
+
+def run_headless(sim, seconds, controller=None):
+    """
+    Step the simulation for a number of simulated seconds without a window.
+    controller(sim) -> PlayerInput is called every tick (no input if None).
+    Returns the number of steps run.
+    """
+    steps = int(round(seconds / sim.timestep))
+    for i in range(steps):
+        if sim.finished:
+            return i
+        sim.step(controller(sim) if controller else NO_INPUT)
+    return steps
+
+
+# =========================
+# RECORDING & REPLAY
+# =========================
+
+# bits of a packed PlayerInput
+INPUT_JUMP_PRESSED = 1
+INPUT_JUMP_HELD = 2
+INPUT_LEFT = 4
+INPUT_RIGHT = 8
+
+REPLAY_MAGIC = b"SMRP"
+REPLAY_VERSION = 9
+REPLAY_HEADER = struct.Struct("<4sHBxQQdII")  # magic, version, flags, seed, level seed, dt, ticks, checkpoint every
+REPLAY_ENDLESS = 1
+
+
+def pack_input(inputs):
+    return (INPUT_JUMP_PRESSED * inputs.jump_pressed | INPUT_JUMP_HELD * inputs.jump_held
+            | INPUT_LEFT * inputs.left | INPUT_RIGHT * inputs.right)
+
+
+# every possible input, so unpacking never allocates
+UNPACKED_INPUTS = [PlayerInput(bool(code & INPUT_JUMP_PRESSED), bool(code & INPUT_JUMP_HELD),
+                               bool(code & INPUT_LEFT), bool(code & INPUT_RIGHT)) for code in range(16)]
+
+
+class InputRecording:
+    # Every tick's input for one session, plus state hashes every
+    # checkpoint_every ticks so a replay can prove it went the same way.
+    # Inputs are run-length packed, one byte per run: low nibble is the
+    # input bits, high nibble is the run length - 1 (so 1..16 ticks).
+
+    def __init__(self, seed, level_seed=None, timestep=FIXED_DT, checkpoint_every=60):
+        self.seed = seed
+        self.level_seed = level_seed  # None unless it's an endless mountain
+        self.timestep = timestep
+        self.checkpoint_every = checkpoint_every
+        self.runs = bytearray()
+        self.ticks = 0
+        self.checkpoints = []  # (tick, state hash before that tick)
+
+    @classmethod
+    def for_sim(cls, sim, checkpoint_every=60):
+        """Start recording sim from its current (freshly reset) state"""
+        level_seed = sim.streamer.seed if sim.streamer is not None else None
+        recording = cls(sim.seed, level_seed, sim.timestep, checkpoint_every)
+        sim.recorder = recording
+        return recording
+
+    @property
+    def endless(self):
+        return self.level_seed is not None
+
+    def record(self, sim, inputs):
+        if self.ticks % self.checkpoint_every == 0:
+            self.checkpoints.append((self.ticks, sim.state_hash()))
+        code = pack_input(inputs)
+        runs = self.runs
+        if runs and runs[-1] & 0x0F == code and runs[-1] < 0xF0:
+            runs[-1] += 0x10
+        else:
+            runs.append(code)
+        self.ticks += 1
+
+    def finish(self, sim):
+        """Hash the final state too, call when the session ends"""
+        if not self.checkpoints or self.checkpoints[-1][0] != self.ticks:
+            self.checkpoints.append((self.ticks, sim.state_hash()))
+
+    def inputs(self):
+        """PlayerInput for each recorded tick, in order"""
+        for byte in self.runs:
+            tick_input = UNPACKED_INPUTS[byte & 0x0F]
+            for _ in range((byte >> 4) + 1):
+                yield tick_input
+
+    def save(self, path):
+        with open(path, "wb") as f:
+            f.write(REPLAY_HEADER.pack(REPLAY_MAGIC, REPLAY_VERSION, REPLAY_ENDLESS if self.endless else 0,
+                                       self.seed, self.level_seed or 0, self.timestep, self.ticks,
+                                       self.checkpoint_every))
+            f.write(struct.pack("<I", len(self.runs)))
+            f.write(self.runs)
+            f.write(struct.pack("<I", len(self.checkpoints)))
+            for tick, state in self.checkpoints:
+                f.write(struct.pack("<I8s", tick, state))
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as f:
+            data = f.read()
+        magic, version, flags, seed, level_seed, timestep, ticks, every = REPLAY_HEADER.unpack_from(data)
+        if magic != REPLAY_MAGIC or version != REPLAY_VERSION:
+            raise ValueError(f"{path} is not a version {REPLAY_VERSION} recording")
+        recording = cls(seed, level_seed if flags & REPLAY_ENDLESS else None, timestep, every)
+        offset = REPLAY_HEADER.size
+        (n_runs,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        recording.runs = bytearray(data[offset:offset + n_runs])
+        offset += n_runs
+        (n_checkpoints,) = struct.unpack_from("<I", data, offset)
+        offset += 4
+        recording.checkpoints = [struct.unpack_from("<I8s", data, offset + i * 12) for i in range(n_checkpoints)]
+        recording.ticks = ticks
+        return recording
+
+
+def replay(recording, verify=True):
+    """
+    Re-run a recording headlessly, as fast as possible.
+    Returns (sim, ticks whose state hash didn't match).
+    """
+    streamer = LevelStreamer(recording.level_seed, threaded=False) if recording.endless else None
+    sim = GameSimulation(timestep=recording.timestep, streamer=streamer, seed=recording.seed, verbose=False)
+    expected = dict(recording.checkpoints) if verify else {}
+    mismatches = []
+
+    tick = 0
+    for tick_input in recording.inputs():
+        if tick in expected and sim.state_hash() != expected[tick]:
+            mismatches.append(tick)
+        sim.step(tick_input)
+        tick += 1
+    if tick in expected and sim.state_hash() != expected[tick]:
+        mismatches.append(tick)
+    return sim, mismatches
+
+
+# =========================
+# SNAPSHOTS & REWIND
+# =========================
+
+# Everything about a GameSimulation that changes every tick, one record per tick
+SNAPSHOT_RECORD = np.dtype([
+    ("ticks", "<i8"), ("time", "<f8"), ("events_now", "<i8"), ("wind_time", "<f8"),
+    ("x", "<f8"), ("y", "<f8"), ("vx", "<f8"), ("vy", "<f8"), ("ax", "<f8"), ("ay", "<f8"),
+    ("prev_x", "<f8"), ("prev_y", "<f8"), ("rect_x", "<i4"), ("rect_y", "<i4"), ("health", "<i8"),
+    ("time_since_left_ground", "<f8"), ("time_since_jump_pressed", "<f8"), ("flags", "u1"),
+    ("target_x", "<f8"), ("target_y", "<f8"),  # where the HazardManager spawns around
+    ("hazards", "<i4"), ("high", "<i4"), ("freed", "<i4"),  # HazardPool count, high, reused slots on the free list
+    ("avalanche_lo", "<i4"), ("avalanche_hi", "<i4"), ("avalanche_ticks", "<i4"), ("avalanche_pending", "<f8"),
+])
+
+# bits of SNAPSHOT_RECORD flags
+SNAP_GROUNDED = 1
+SNAP_CLIMBING = 2
+SNAP_SLIDING = 4
+SNAP_WAS_GROUNDED = 8
+SNAP_WON = 16
+SNAP_OVER = 32
+SNAP_WARNING = 64
+SNAP_AVALANCHE = 128
+
+
+class SimSnapshots:
+    # The last few seconds of a GameSimulation, a snapshot per tick in a ring
+    # buffer that's allocated up front, for rewinding and for tests that want
+    # to go back to a known state.
+    # Per-tick values go in a SNAPSHOT_RECORD and the hazard pool's columns in
+    # preallocated rows, so capture() is a few array copies. The timer wheel,
+    # who holds which Timer, the avalanche and the RNG states only change when
+    # a timer is added, fires or is cancelled, so they're a delta: taken again
+    # when TimerWheel.version moves on and shared by every tick until then.
+    # The level isn't stored, sections stream back in from their seeds: restore()
+    # streams around where the player was and gives the spawners live now their
+    # timers, the delta's timers belong to the spawners that were live back then.
+
+    HAZARD_COLUMNS = ("x", "y", "prev_y", "fallsp", "type", "active")
+
+    def __init__(self, sim, seconds=10.0, hazard_slots=256):
+        self.sim = sim
+        self.capacity = round(seconds / sim.timestep) + 1  # the tick seconds ago, and every one since
+        self.records = np.zeros(self.capacity, SNAPSHOT_RECORD)
+        self.deltas = [None] * self.capacity
+        self.grounds = [None] * self.capacity  # player.ground, platforms are shared, not copied
+        self.platforms = [None] * self.capacity  # sim.cur_platform
+        self.columns = {}
+        self.freed = None
+        self._grow(hazard_slots)
+        self.snow = None  # packed avalanche grids, once there is one
+        # per-type hazard data, to fill the pool's other columns back in from type
+        kinds = sorted(HAZARD_KINDS.values())
+        self.kind_damage = np.array([kind[1] for kind in kinds], np.int32)
+        self.kind_w = np.array([kind[2] for kind in kinds], float)
+        self.kind_h = np.array([kind[3] for kind in kinds], float)
+        sim.snapshots = self
+        self.clear()
+
+    def __len__(self):
+        return self.count
+
+    @property
+    def oldest(self):
+        return self.newest - self.count + 1
+
+    def _grow(self, slots):
+        pool = self.sim.hazard_manager.pool
+        for name in self.HAZARD_COLUMNS:
+            old = self.columns.get(name)
+            grown = np.zeros((self.capacity, slots), getattr(pool, name).dtype)
+            if old is not None:
+                grown[:, :old.shape[1]] = old
+            self.columns[name] = grown
+        grown = np.zeros((self.capacity, slots), np.int32)
+        if self.freed is not None:
+            grown[:, :self.freed.shape[1]] = self.freed
+        self.freed = grown
+        self.slots = slots
+
+    def clear(self):
+        """Forget everything and start again from the sim as it is now (after a reset)"""
+        self.count = 0
+        self.newest = self.sim.ticks - 1
+        self.version = None
+        self.delta = None
+        self.capture()
+
+    def capture(self):
+        """Snapshot the sim as it is now, over the oldest tick once the buffer is full"""
+        sim = self.sim
+        player = sim.player
+        hm = sim.hazard_manager
+        pool = hm.pool
+        events = sim.events
+        i = sim.ticks % self.capacity
+
+        if events.version != self.version:
+            self.version = events.version
+            self.delta = (events.snapshot(), sim.rng.getstate(), player.invinc_end, hm.spawn_timer,
+                          hm.warning_timer, hm.avalanche_start, tuple(hm.spawner_timers.items()), hm.avalanche)
+        self.deltas[i] = self.delta
+        self.grounds[i] = player.ground
+        self.platforms[i] = sim.cur_platform
+
+        n = pool.high
+        if n > self.slots:
+            self._grow(max(n, self.slots * 2))
+        for name, column in self.columns.items():
+            column[i, :n] = getattr(pool, name)[:n]
+        # the free list is every never-used slot (highest first), then the freed ones in order
+        freed = pool.free[pool.capacity - n:]
+        if freed:
+            self.freed[i, :len(freed)] = freed
+
+        avalanche = hm.avalanche
+        lo = hi = av_ticks = 0
+        av_pending = 0.0
+        if avalanche is not None:
+            packed = np.packbits(avalanche.snow)
+            if self.snow is None or self.snow.shape[1] != len(packed):
+                self.snow = np.zeros((self.capacity, len(packed)), np.uint8)
+            self.snow[i] = packed
+            lo, hi, av_ticks, av_pending = avalanche.lo, avalanche.hi, avalanche.ticks, avalanche.pending
+
+        flags = (SNAP_GROUNDED * player.is_grounded | SNAP_CLIMBING * player.is_climbing
+                 | SNAP_SLIDING * player.is_sliding | SNAP_WAS_GROUNDED * player.was_grounded_last_frame
+                 | SNAP_WON * sim.game_won | SNAP_OVER * sim.game_over
+                 | SNAP_WARNING * hm.avalanche_warning | SNAP_AVALANCHE * hm.avalanche_active)
+        position, velocity, acceleration = player.position, player.velocity, player.acceleration
+        self.records[i] = (
+            sim.ticks, sim.time, events.now, sim.weather.time,
+            position.x, position.y, velocity.x, velocity.y, acceleration.x, acceleration.y,
+            sim.prev_player_pos.x, sim.prev_player_pos.y, player.rect.x, player.rect.y, player.health,
+            player.time_since_left_ground, player.time_since_jump_pressed, flags,
+            hm.player_x, hm.player_y, pool.count, n, len(freed), lo, hi, av_ticks, av_pending)
+
+        self.newest = sim.ticks
+        self.count = min(self.count + 1, self.capacity)
+
+    def restore(self, tick):
+        """Put the sim back how it was at tick, and forget every tick after it"""
+        sim = self.sim
+        if not self.oldest <= tick <= self.newest:
+            raise ValueError(f"tick {tick} isn't snapshotted, only {self.oldest}..{self.newest} are")
+        if sim.recorder is not None:
+            raise ValueError("can't rewind a sim that's being recorded, the recording wouldn't replay")
+        i = tick % self.capacity
+        (ticks, sim.time, events_now, sim.weather.time, x, y, vx, vy, ax, ay, prev_x, prev_y, rect_x, rect_y,
+         health, left_ground, jump_pressed, flags, target_x, target_y, count, n, freed,
+         lo, hi, av_ticks, av_pending) = self.records[i].item()
+        player = sim.player
+        hm = sim.hazard_manager
+        pool = hm.pool
+
+        sim.ticks = ticks
+        sim.game_won = bool(flags & SNAP_WON)
+        sim.game_over = bool(flags & SNAP_OVER)
+        sim.prev_player_pos.update(prev_x, prev_y)
+        sim.cur_platform = self.platforms[i]
+        sim.accumulator = 0.0
+        sim.pending_jump = False
+
+        player.position.update(x, y)
+        player.velocity.update(vx, vy)
+        player.acceleration.update(ax, ay)
+        player.rect.topleft = (rect_x, rect_y)
+        player.health = health
+        player.time_since_left_ground = left_ground
+        player.time_since_jump_pressed = jump_pressed
+        player.is_grounded = bool(flags & SNAP_GROUNDED)
+        player.is_climbing = bool(flags & SNAP_CLIMBING)
+        player.is_sliding = bool(flags & SNAP_SLIDING)
+        player.was_grounded_last_frame = bool(flags & SNAP_WAS_GROUNDED)
+        player.ground = self.grounds[i]
+
+        if self.deltas[i] is self.delta and sim.events.version == self.version:
+            sim.events.now = events_now  # no timer has changed since, nor has anything else in the delta
+        else:
+            self.delta = self.deltas[i]
+            (wheel, rng_state, player.invinc_end, hm.spawn_timer, hm.warning_timer, hm.avalanche_start,
+             spawner_timers, hm.avalanche) = self.delta
+            sim.events.restore(events_now, wheel)
+            self.version = sim.events.version
+            sim.rng.setstate(rng_state)
+            hm.spawner_timers = dict(spawner_timers)
+        hm.player_x, hm.player_y = target_x, target_y
+        hm.avalanche_warning = bool(flags & SNAP_WARNING)
+        hm.avalanche_active = bool(flags & SNAP_AVALANCHE)
+
+        pool.active[n:pool.high] = False
+        for name, column in self.columns.items():
+            getattr(pool, name)[:n] = column[i, :n]
+        kinds = pool.type[:n]
+        pool.w[:n] = self.kind_w[kinds]
+        pool.h[:n] = self.kind_h[kinds]
+        pool.damage[:n] = self.kind_damage[kinds]
+        pool.free = list(range(pool.capacity - 1, n - 1, -1)) + self.freed[i, :freed].tolist()
+        pool.high = n
+        pool.count = count
+
+        avalanche = hm.avalanche
+        if avalanche is not None:
+            snow = avalanche.snow
+            snow[...] = np.unpackbits(self.snow[i], count=snow.size).reshape(snow.shape)
+            avalanche.lo, avalanche.hi, avalanche.ticks, avalanche.pending = lo, hi, av_ticks, av_pending
+            avalanche.drawn_tick = None
+
+        if sim.streamer is not None:
+            sim.stream_level()
+        hm.set_spawners(sim.spawners)
+
+        self.count -= self.newest - tick
+        self.newest = tick
+
+    def rewind(self, ticks=1):
+        """Go back up to ticks ticks (not past the oldest snapshot), returns the tick it's at now"""
+        tick = max(self.oldest, self.newest - ticks)
+        self.restore(tick)
+        return tick
+
+
+# =========================
+# TRAINING ENVIRONMENTS
+# =========================
+# Gym-style environments for climbing bots. Actions are packed PlayerInput
+# bits (0-15, see pack_input), observations a flat float32 vector:
+#   12 player values, then the ENV_PLATFORMS nearest platforms as
+#   (dx, dy, w, h, ice) and the ENV_HAZARDS nearest hazards as
+#   (dx, dy, fall speed, type), all relative to the player and about unit
+#   sized. Missing platforms or hazards are left as zeros.
+
+ENV_PLATFORMS = 8
+ENV_HAZARDS = 8
+OBS_SIZE = 12 + 5 * ENV_PLATFORMS + 4 * ENV_HAZARDS
+
+
+class ClimbEnv:
+    # One GameSimulation on an endless mountain. Reward is height gained
+    # above the best so far (per 100 px), +10 for reaching the goal and -10
+    # for dying. Falling FALL_LIMIT px below the best height counts as dying,
+    # the game itself would let you fall forever. Each env keeps its own
+    # mountain, every episode gets new hazards and weather.
+
+    ACTIONS = len(UNPACKED_INPUTS)
+    FALL_LIMIT = 1200
+
+    def __init__(self, seed=0, max_steps=3600, tick_rate=60):
+        self.seed = seed
+        self.max_steps = max_steps
+        self.episodes = 0
+        self.sim = GameSimulation(1.0 / tick_rate, streamer=LevelStreamer(seed, threaded=False), seed=seed,
+                                  verbose=False)  # no prints from every hazard hit
+        self.view = pygame.Rect(0, 0, 800, 600)  # where nearby platforms are looked for
+        self.best_y = self.sim.player.position.y
+
+    def reset(self, out=None):
+        """Start a new episode and return its first observation"""
+        sim = self.sim
+        sim.seed = self.seed + self.episodes * 7919
+        self.episodes += 1
+        sim.reset()
+        self.best_y = sim.player.position.y
+        return self.observe(out)
+
+    def step(self, action, out=None):
+        """Run one tick, returns (observation, reward, done, info)"""
+        sim = self.sim
+        sim.step(UNPACKED_INPUTS[action])
+        y = sim.player.position.y
+        reward = 0.0
+        if y < self.best_y:
+            reward = (self.best_y - y) / 100
+            self.best_y = y
+        fell = y > self.best_y + self.FALL_LIMIT
+        if sim.game_won:
+            reward += 10.0
+        elif sim.game_over or fell:
+            reward -= 10.0
+        done = sim.finished or fell
+        truncated = sim.ticks >= self.max_steps and not done
+        return self.observe(out), reward, done or truncated, {"truncated": truncated}
+
+    def observe(self, out=None):
+        """Write the observation into out (or a new array) and return it"""
+        if out is None:
+            out = np.empty(OBS_SIZE, np.float32)
+        sim = self.sim
+        player = sim.player
+        hm = sim.hazard_manager
+        px, py = player.rect.center
+        goal = sim.goal
+        gx, gy = ((goal.rect.centerx - px) / 800, (goal.rect.centery - py) / 600) if goal is not None else (0.0, 0.0)
+        values = [player.velocity.x / 400, player.velocity.y / 1000, player.is_grounded, player.is_sliding,
+                  player.health / player.max_health, player.invinc_end is not None, hm.avalanche_timer / 60,
+                  hm.avalanche_warning, sim.weather.wind_at(px, py) / 100, gx, gy, sim.ticks / self.max_steps]
+
+        view = self.view
+        view.center = px, py
+        near = []
+        for p in sim.solids_near(view):
+            r = p.rect
+            dx = r.centerx - px
+            dy = r.centery - py
+            near.append((dx * dx + dy * dy, dx, dy, r.w, r.h, p.surface == "ice"))
+        near.sort()
+        for _, dx, dy, w, h, ice in near[:ENV_PLATFORMS]:
+            values += (dx / 800, dy / 600, w / 800, h / 600, ice)
+        values += [0.0] * (5 * (ENV_PLATFORMS - min(len(near), ENV_PLATFORMS)))
+
+        pool = hm.pool
+        slots = pool.active_slots()
+        near = []
+        if len(slots):
+            types = pool.type[slots].tolist()
+            falls = pool.fallsp[slots].tolist()
+            for x, y, w, h, fallsp, type_code in zip(pool.x[slots].tolist(), pool.y[slots].tolist(),
+                                                     pool.w[slots].tolist(), pool.h[slots].tolist(), falls, types):
+                dx = x + w / 2 - px
+                dy = y + h / 2 - py
+                near.append((dx * dx + dy * dy, dx, dy, fallsp, type_code))
+            near.sort()
+        for _, dx, dy, fallsp, type_code in near[:ENV_HAZARDS]:
+            values += (dx / 800, dy / 600, fallsp / 500, type_code)
+        values += [0.0] * (4 * (ENV_HAZARDS - min(len(near), ENV_HAZARDS)))
+
+        out[:] = values
+        return out
+
+    def close(self):
+        self.sim.streamer.close()
+
+
+def vec_env_arrays(buf, num_envs):
+    """(observations, rewards, dones, actions) laid out over one buffer"""
+    obs = np.ndarray((num_envs, OBS_SIZE), np.float32, buf)
+    offset = obs.nbytes
+    rewards = np.ndarray(num_envs, np.float32, buf, offset)
+    offset += rewards.nbytes
+    dones = np.ndarray(num_envs, np.bool_, buf, offset)
+    actions = np.ndarray(num_envs, np.uint8, buf, offset + num_envs)
+    return obs, rewards, dones, actions
+
+
+def vec_env_bytes(num_envs):
+    return num_envs * (OBS_SIZE * 4 + 4 + 1 + 1)
+
+
+def run_envs(envs, first, command, obs, rewards, dones, actions):
+    # reset or step envs[i] as env number first + i, finished ones start over
+    if command == b"r":
+        for i, env in enumerate(envs, first):
+            env.reset(obs[i])
+        rewards[first:first + len(envs)] = 0
+        dones[first:first + len(envs)] = False
+        return
+    for i, (env, action) in enumerate(zip(envs, actions[first:first + len(envs)].tolist()), first):
+        _, rewards[i], done, _ = env.step(action, obs[i])
+        dones[i] = done
+        if done:
+            env.reset(obs[i])
+
+
+def vec_env_worker(conn, shm_name, num_envs, first, seeds, env_kwargs):
+    # Runs in its own process: builds its envs, then steps them on command
+    from multiprocessing import shared_memory
+
+    shm = shared_memory.SharedMemory(name=shm_name)
+    arrays = vec_env_arrays(shm.buf, num_envs)
+    envs = [ClimbEnv(seed, **env_kwargs) for seed in seeds]
+    try:
+        while True:
+            command = conn.recv_bytes()
+            if command == b"q":
+                break
+            run_envs(envs, first, command, *arrays)
+            conn.send_bytes(b"k")
+    finally:
+        for env in envs:
+            env.close()
+        del arrays
+        shm.close()
+
+
+class VecClimbEnv:
+    # num_envs ClimbEnvs split across worker processes. Observations,
+    # rewards, dones and actions all live in one shared memory block, so a
+    # step only sends a one-byte command to each worker and nothing per env
+    # gets pickled. Envs that finish reset straight away, so that step's
+    # observation is already the next episode's first.
+    # workers=0 runs every env in this process on the same arrays.
+
+    def __init__(self, num_envs, workers=None, seed=0, **env_kwargs):
+        import multiprocessing
+        from multiprocessing import shared_memory
+
+        self.num_envs = num_envs
+        if workers is None:
+            workers = os.cpu_count() or 1
+        workers = min(workers, num_envs)
+        self.shm = shared_memory.SharedMemory(create=True, size=vec_env_bytes(num_envs))
+        self.obs, self.rewards, self.dones, self.actions = vec_env_arrays(self.shm.buf, num_envs)
+        self.envs = []
+        self.conns = []
+        self.procs = []
+        if not workers:
+            self.envs = [ClimbEnv(seed + i, **env_kwargs) for i in range(num_envs)]
+        for w in range(workers):
+            first = num_envs * w // workers
+            last = num_envs * (w + 1) // workers
+            conn, child = multiprocessing.Pipe()
+            proc = multiprocessing.Process(
+                target=vec_env_worker, daemon=True,
+                args=(child, self.shm.name, num_envs, first, range(seed + first, seed + last), env_kwargs))
+            proc.start()
+            child.close()
+            self.conns.append(conn)
+            self.procs.append(proc)
+
+    def _run(self, command):
+        if self.envs:
+            run_envs(self.envs, 0, command, self.obs, self.rewards, self.dones, self.actions)
+        for conn in self.conns:
+            conn.send_bytes(command)
+        for conn in self.conns:
+            conn.recv_bytes()
+
+    def reset(self):
+        """Reset every env, returns the observations (num_envs x OBS_SIZE, shared, don't hold on to it)"""
+        self._run(b"r")
+        return self.obs
+
+    def step(self, actions):
+        """Step every env with its action, returns (observations, rewards, dones), all shared buffers"""
+        self.actions[:] = actions
+        self._run(b"s")
+        return self.obs, self.rewards, self.dones
+
+    def close(self):
+        if self.shm is None:
+            return
+        for conn in self.conns:
+            conn.send_bytes(b"q")
+        for proc in self.procs:
+            proc.join()
+        for env in self.envs:
+            env.close()
+        del self.obs, self.rewards, self.dones, self.actions
+        self.shm.close()
+        self.shm.unlink()
+        self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+# =========================
+# PARTICLES
+# =========================
+
+class SnowParticles:
+    # Snowflakes kept as NumPy arrays in a fixed-size ring buffer. New flakes
+    # are written at the head over the oldest ones, flakes that fall off the
+    # bottom wrap back to the top, and every flake is moved and drawn with a
+    # handful of whole-array operations instead of a Python loop.
+    # Purely cosmetic: it has its own rng and never touches the simulation.
+
+    FLAKES_PER_INTENSITY = 12000  # live flakes per point of WeatherSystem.snow_intensity
+    GRAVITY = 60.0  # px/s^2, snow reaches its terminal speed quickly
+    DRAG = 0.5  # 1/s, how fast flakes settle into the wind's speed
+    NEAR_DEPTH = 0.8  # flakes this close to the camera are drawn 2x2
+    DETAIL_BUDGET = 25000  # past this many flakes everything is 1px, nobody can tell in a blizzard
+    COLOR = (245, 250, 255)
+
+    def __init__(self, size=(800, 600), capacity=60000, seed=0):
+        self.width, self.height = size
+        self.capacity = capacity
+        self.rng = np.random.default_rng(seed)
+        self.x = np.zeros(capacity, np.float32)
+        self.y = np.zeros(capacity, np.float32)
+        self.vx = np.zeros(capacity, np.float32)
+        self.vy = np.zeros(capacity, np.float32)
+        self.depth = np.zeros(capacity, np.float32)  # 0 far away .. 1 right in front
+        self.terminal = np.zeros(capacity, np.float32)  # fall speed, far flakes fall slower
+        self.head = 0  # next slot to write
+        self.count = 0  # live flakes, the ones just behind head
+        self.spawn_rate = capacity  # flakes/s added or retired while following the intensity
+        self.flake = None  # 2x2 surface for screens surfarray can't write to
+
+    def target_count(self, intensity):
+        return min(self.capacity, int(intensity * self.FLAKES_PER_INTENSITY))
+
+    def spans(self):
+        """The live part of the ring as one or two slices"""
+        start = (self.head - self.count) % self.capacity
+        if start + self.count <= self.capacity:
+            return (slice(start, start + self.count),)
+        return (slice(start, self.capacity), slice(0, self.head))
 
+    def spawn(self, n, fill=False):
+        """Add n flakes above the screen (or all over it with fill), overwriting the oldest"""
+        n = min(n, self.capacity)
+        if n <= 0:
+            return
+        slots = (self.head + np.arange(n)) % self.capacity
+        rng = self.rng
+        depth = rng.random(n, np.float32)
+        self.depth[slots] = depth
+        self.terminal[slots] = 25.0 + 95.0 * depth
+        self.x[slots] = rng.uniform(0, self.width, n)
+        self.y[slots] = rng.uniform(-self.height, self.height if fill else 0, n)
+        self.vx[slots] = 0.0
+        self.vy[slots] = self.terminal[slots]
+        self.head = (self.head + n) % self.capacity
+        self.count = min(self.count + n, self.capacity)
 
+    def retire(self, n):
+        """Drop the n oldest flakes"""
+        self.count -= min(n, self.count)
+
+    def scroll(self, dx, dy):
+        """The camera moved by (dx, dy) screen px, nearer flakes move further"""
+        if not (dx or dy) or self.count == 0:
+            return
+        wrap = np.float32(self.height * 2)
+        for s in self.spans():
+            depth = self.depth[s]
+            x = self.x[s]
+            x += depth * dx
+            x %= self.width
+            y = self.y[s]
+            y += depth * dy
+            y[y >= self.height] -= wrap
+            y[y < -self.height] += wrap
+
+    def update(self, dt, weather, camera_offset=(0, 0)):
+        # ease the number of flakes towards what the weather wants
+        target = self.target_count(weather.snow_intensity)
+        step = max(1, int(self.spawn_rate * dt))
+        if self.count == 0 and target:
+            self.spawn(target, fill=True)  # don't start on an empty sky
+        elif self.count < target:
+            self.spawn(min(target - self.count, step))
+        elif self.count > target:
+            self.retire(min(self.count - target, step))
+
+        ox, oy = camera_offset
+        drag = self.DRAG
+        fall = self.GRAVITY * dt
+        wrap = np.float32(self.height * 2)  # same band new flakes start in
+        for s in self.spans():
+            # flakes are pushed by the wind where they are, in proportion to how near they are (parallax)
+            vx = self.vx[s]
+            x = self.x[s]
+            wind = weather.wind_array(x - ox, self.y[s] - oy, smooth=False)
+            vx += (wind * self.depth[s] - drag * vx) * dt
+            vy = self.vy[s]
+            vy += fall
+            np.minimum(vy, self.terminal[s], out=vy)
+
+            x += vx * dt
+            x %= self.width
+            y = self.y[s]
+            y += vy * dt
+            y[y >= self.height] -= wrap
+
+    def draw(self, screen):
+        """Plot every flake on screen, returns the rect it covers"""
+        rect = screen.get_rect()
+        if self.count == 0:
+            return pygame.Rect(0, 0, 0, 0)
+        if screen.get_bytesize() == 3:
+            self._draw_blits(screen)  # surfarray can't reference 24 bit pixels
+            return rect
+
+        w, h = screen.get_size()
+        color = screen.map_rgb(self.COLOR)
+        detail = self.count <= self.DETAIL_BUDGET
+        pixels = pygame.surfarray.pixels2d(screen)  # locks screen until del
+        for s in self.spans():
+            xi = self.x[s].astype(np.intp)
+            yi = self.y[s].astype(np.intp)
+            on = (yi >= 0) & (yi < h - 1) & (xi < w - 1)
+            if detail:
+                near = np.flatnonzero(on & (self.depth[s] >= self.NEAR_DEPTH))
+                nx = xi[near]
+                ny = yi[near]
+                pixels[nx + 1, ny] = color
+                pixels[nx, ny + 1] = color
+                pixels[nx + 1, ny + 1] = color
+            on = np.flatnonzero(on)
+            pixels[xi[on], yi[on]] = color
+        del pixels
+        return rect
+
+    def _draw_blits(self, screen):
+        if self.flake is None:
+            self.flake = pygame.Surface((2, 2))
+            self.flake.fill(self.COLOR)
+        flake = self.flake
+        screen.fblits([(flake, (x, y)) for s in self.spans()
+                       for x, y in zip(self.x[s].tolist(), self.y[s].tolist())])
+
+
+# =========================
+# RENDERING
+# =========================
+
+def lerp(a, b, t):
+    return a + (b - a) * t
+
+
+def world_offset(camera_offset):
+    # The world layer snaps to whole pixels so terrain, player and hazards
+    # never shimmer against each other, only the parallax layers go sub-pixel
+    return (round(camera_offset[0]), round(camera_offset[1]))
+
+
+def new_surface(size):
+    # Blank surface in the display's pixel format when there is one, so blits are fast
+    display = pygame.display.get_surface()
+    return pygame.Surface(size, 0, display) if display else pygame.Surface(size)
+
+
+def cutout(image, key_color, area=None, tint=None):
+    """
+    Copy of image (or just area of it) where key_color is see-through,
+    optionally blended towards tint=(color, amount) first
+    """
+    if area is not None:
+        image = image.subsurface(area)
+    mask = pygame.mask.from_threshold(image, key_color, (1, 1, 1, 255))
+    mask.invert()
+    source = new_surface(image.get_size())  # to_surface wants matching pixel formats
+    source.blit(image, (0, 0))
+    if tint is not None:
+        color, amount = tint
+        veil = pygame.Surface(source.get_size(), pygame.SRCALPHA)
+        veil.fill((*color[:3], int(255 * amount)))
+        source.blit(veil, (0, 0))
+    layer = new_surface(image.get_size())
+    layer.fill(TerrainChunks.KEY_COLOR)
+    mask.to_surface(layer, setsurface=source, unsetcolor=None)
+    layer.set_colorkey(TerrainChunks.KEY_COLOR, pygame.RLEACCEL)
+    return layer
+
+
+class ParallaxLayer:
+    # One pre-rendered background strip. It tiles horizontally every
+    # surface width, so drawing it is a fixed 2-3 blits however far the
+    # camera has gone. factor is how far it moves per pixel of camera
+    # movement (0 = painted on the sky, 1 = moves with the world).
+
+    def __init__(self, surface, factor, pos=(0, 0), factor_y=None, drift=0.0, wrap=True):
+        self.surface = surface
+        self.factor = factor
+        self.factor_y = factor if factor_y is None else factor_y
+        self.x, self.y = pos  # where it sits with the camera at the start
+        self.drift = drift  # px/s it slides by on its own (clouds)
+        self.wrap = wrap
+
+    def draw(self, screen, camera_offset, time=0.0):
+        # float offsets all the way down, only the final blit position is rounded,
+        # and every tile uses the same rounding so there are no seams
+        ox, oy = camera_offset
+        view_w, view_h = screen.get_size()
+        surface = self.surface
+        y = math.floor(self.y + oy * self.factor_y)
+        if y >= view_h or y + surface.get_height() <= 0:
+            return
+        x = self.x + ox * self.factor + self.drift * time
+        if not self.wrap:
+            screen.blit(surface, (math.floor(x), y))
+            return
+        w = surface.get_width()
+        x = math.floor(x % w) - w
+        while x < view_w:
+            if x + w > 0:
+                screen.blit(surface, (x, y))
+            x += w
+
+
+class ParallaxBackground:
+    # Sky colour plus layers cut out of background.png: the sun, a far hazy
+    # range, drifting clouds and the big mountain. Everything is built once,
+    # so scrolling never rescales or re-renders anything.
+
+    def __init__(self, image, view_size=(800, 600), seed=0):
+        view_w, view_h = view_size
+        w, h = image.get_size()
+        self.sky = image.get_at((w - 1, 0))  # top-right corner is always clear sky
+        rng = random.Random(seed)
+
+        # background.png: sun in the top-left, mountain on the right half.
+        # The mountain is cut off at the right edge, so a mirrored copy next
+        # to it closes it into a ridge, then some open sky before it repeats.
+        mountain = cutout(image, self.sky, pygame.Rect(w * 5 // 16, 0, w - w * 5 // 16, h))
+        ridge = new_surface((mountain.get_width() * 2 + view_w // 2, h))
+        ridge.fill(TerrainChunks.KEY_COLOR)
+        ridge.blit(mountain, (0, 0))
+        ridge.blit(pygame.transform.flip(mountain, True, False), (mountain.get_width(), 0))
+        ridge.set_colorkey(TerrainChunks.KEY_COLOR, pygame.RLEACCEL)
+
+        far = cutout(pygame.transform.scale(ridge, (ridge.get_width() // 2, h // 2)), TerrainChunks.KEY_COLOR,
+                     tint=(self.sky, 0.45))
+        sun = cutout(image, self.sky, pygame.Rect(0, 0, w // 8, h * 3 // 16))
+
+        self.layers = [
+            ParallaxLayer(sun, 0.0, factor_y=0.02, wrap=False),
+            ParallaxLayer(far, 0.1, (view_w // 3, view_h - far.get_height())),
+            ParallaxLayer(self.build_clouds(rng, view_w + 224, view_h // 3), 0.2, (0, view_h // 12), drift=-6.0),
+            ParallaxLayer(ridge, 0.3, (w * 5 // 16, view_h - h)),
+        ]
+
+    def build_clouds(self, rng, width, height, pixel=8):
+        # drawn small and scaled up with no smoothing so the clouds are as
+        # chunky as the rest of the pixel art. Each puff is drawn again one
+        # tile left and right so the tile wraps cleanly.
+        light = (235, 240, 250)
+        shade = (170, 176, 189)
+        small = pygame.Surface((width // pixel, height // pixel))
+        small.fill(TerrainChunks.KEY_COLOR)
+        sw, sh = small.get_size()
+        for _ in range(6):
+            cx = rng.randrange(sw)
+            cy = rng.randrange(sh // 4, sh - 3)
+            puffs = [(cx + rng.randint(-6, 6), cy + rng.randint(-2, 1), rng.randint(5, 10), rng.randint(3, 4))
+                     for _ in range(3)]
+            for color, drop in ((shade, 1), (light, 0)):
+                for px, py, pw, ph in puffs:
+                    for wrap_x in (-sw, 0, sw):
+                        pygame.draw.ellipse(small, color, (px + wrap_x - pw // 2, py + drop - ph // 2, pw, ph))
+        clouds = pygame.transform.scale(small, (sw * pixel, sh * pixel))
+        return cutout(clouds, TerrainChunks.KEY_COLOR)
+
+    def draw(self, screen, camera_offset=(0, 0), time=0.0):
+        screen.fill(self.sky)
+        for layer in self.layers:
+            layer.draw(screen, camera_offset, time)
+
+
+class TerrainChunks:
+    # Platforms never change after generation, so instead of drawing each one
+    # every frame they are baked into square chunk surfaces. Only chunks that
+    # overlap the view get blitted, and chunks that wander far off screen are
+    # freed and baked again if we come back to them.
+
+    CHUNK_SIZE = 512
+    KEY_COLOR = (255, 0, 255)  # transparent colour of the chunk surfaces
+
+    def __init__(self, platforms=(), chunk_size=CHUNK_SIZE, keep_margin=1):
+        self.chunk_size = chunk_size
+        self.keep_margin = keep_margin  # chunks kept around past the view edge
+        self.grid = SpatialHash(chunk_size)  # chunk cells == grid cells
+        self.chunks = {}  # (cx, cy) -> baked Surface
+        for p in platforms:
+            self.add(p)
+
+    def add(self, platform):
+        self.grid.insert(platform)
+        self._drop(platform)
+
+    def remove(self, platform):
+        self._drop(platform)
+        self.grid.remove(platform)
+
+    def sync(self, platforms):
+        """Make the baked set match platforms, only touching what changed"""
+        keep = set(platforms)
+        for p in [p for p in self.grid.entries if p not in keep]:
+            self.remove(p)
+        for p in platforms:
+            if p not in self.grid:
+                self.add(p)
+
+    def _drop(self, platform):
+        # forget every baked chunk the platform touches
+        entry = self.grid.entries.get(platform)
+        if entry is None:
+            return
+        cx0, cy0, cx1, cy1 = entry[0]
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                self.chunks.pop((cx, cy), None)
+
+    def _bake(self, cx, cy):
+        cs = self.chunk_size
+        chunk = new_surface((cs, cs))
+        chunk.fill(self.KEY_COLOR)
+        chunk.set_colorkey(self.KEY_COLOR, pygame.RLEACCEL)
+        ox = cx * cs
+        oy = cy * cs
+        cell = self.grid.cells.get((cx, cy), {})
+        for p in sorted(cell, key=cell.get):
+            pygame.draw.rect(chunk, p.color, p.rect.move(-ox, -oy))
+        return chunk
+
+    def draw(self, screen, camera_offset=(0, 0)):
+        """Blit the chunks under the view, camera_offset is added to world coords"""
+        cs = self.chunk_size
+        ox, oy = camera_offset
+        view_w, view_h = screen.get_size()
+        cx0 = int(-ox // cs)
+        cy0 = int(-oy // cs)
+        cx1 = int((-ox + view_w - 1) // cs)
+        cy1 = int((-oy + view_h - 1) // cs)
+
+        cells = self.grid.cells
+        chunks = self.chunks
+        for cx in range(cx0, cx1 + 1):
+            for cy in range(cy0, cy1 + 1):
+                if (cx, cy) not in cells:
+                    continue  # nothing there
+                chunk = chunks.get((cx, cy))
+                if chunk is None:
+                    chunk = chunks[(cx, cy)] = self._bake(cx, cy)
+                screen.blit(chunk, (cx * cs + ox, cy * cs + oy))
+
+        # free the ones we've left behind
+        m = self.keep_margin
+        for key in [k for k in chunks
+                    if not (cx0 - m <= k[0] <= cx1 + m and cy0 - m <= k[1] <= cy1 + m)]:
+            del chunks[key]
+
+
+class GameRenderer:
+    # Draws a GameSimulation, blending between the previous and current
+    # sim state so motion stays smooth when render and physics rates differ.
+    # camera_offset (see Camera.offset) is added to every world position,
+    # the HUD stays in screen space.
+
+    ANIMATED_BACKGROUND = True  # clouds drift with sim time
+
+    def __init__(self, snow=True, penguins=12):
+        self.hud = Hud()  # None when something else draws the HUD
+        self.background = None  # ParallaxBackground, built on the first frame
+        self.penguin_count = penguins  # huddling on the base terrain
+        self.penguins = None  # PenguinHuddle, made for each new sim
+        self.penguin_terrain = None
+        self.penguin_sprites = None  # (facing right, facing left)
+        self.snow = SnowParticles() if snow else None
+        self.snow_offset = None
+        self.effects_tick = 0
+        self.terrain_chunks = TerrainChunks()
+        self.terrain_source = None
+        self.terrain_version = None
+        self.timer = None  # LapTimer, when someone wants per-phase timings
+
+    def draw(self, screen, sim, alpha=1.0, camera_offset=(0, 0)):
+        """Draw a full frame. Returns None, meaning the whole screen changed"""
+        self.draw_static(screen, sim, camera_offset)
+        self.draw_dynamic(screen, sim, alpha, camera_offset)
+        return None
+
+    def draw_static(self, screen, sim, camera_offset=(0, 0)):
+        # Everything that only moves with the camera: background and terrain
+        timer = self.timer
+        if timer:
+            timer.start()
+        if self.background is None:
+            self.background = ParallaxBackground(assets.get("background"), screen.get_size())
+        self.background.draw(screen, camera_offset, sim.time if self.ANIMATED_BACKGROUND else 0.0)
+        if timer:
+            timer.lap("background")
+
+        self.sync_terrain(sim)
+        self.terrain_chunks.draw(screen, world_offset(camera_offset))
+        if timer:
+            timer.lap("terrain")
+
+    def sync_terrain(self, sim):
+        """Re-bake whatever changed since the sim's platforms last changed, True if anything did"""
+        if self.terrain_source is sim.plats and self.terrain_version == sim.level_version:
+            return False
+        self.terrain_source = sim.plats
+        self.terrain_version = sim.level_version
+        self.terrain_chunks.sync([sim.terrain] + sim.plats)
+        return True
+
+    def draw_dynamic(self, screen, sim, alpha, camera_offset=(0, 0)):
+        # Everything that moves, returns the screen rects it touched
+        player = sim.player
+        ox, oy = world_offset(camera_offset)
+        drawn = []
+        timer = self.timer
+        if timer:
+            timer.start()
+
+        self.update_effects(sim)
+        if timer:
+            timer.lap("effects")
+
+        if self.penguins is not None:
+            drawn.extend(self.draw_penguins(screen, self.penguins, (ox, oy)))
+            if timer:
+                timer.lap("penguins")
+
+        px = lerp(sim.prev_player_pos.x, player.position.x, alpha)
+        py = lerp(sim.prev_player_pos.y, player.position.y, alpha)
+
+        drawn.append(screen.blit(player.sprite, (px + ox, py + oy)))
+        if timer:
+            timer.lap("player")
+
+        pool = sim.hazard_manager.pool
+        for i in pool.active_slots():
+            drawn.append(screen.blit(hazard_sprite(pool.type[i]),
+                                     (pool.x[i] + ox, lerp(pool.prev_y[i], pool.y[i], alpha) + oy)))
+        avalanche = sim.hazard_manager.avalanche
+        if avalanche is not None:
+            drawn.append(avalanche.draw(screen, (ox, oy)))
+        if timer:
+            timer.lap("hazards")
+
+        if self.snow is not None:
+            drawn.append(self.draw_snow(screen, camera_offset))
+            if timer:
+                timer.lap("snow")
+
+        if self.hud is not None:
+            drawn.extend(self.hud.draw(screen, player, sim.hazard_manager))
+            if timer:
+                timer.lap("hud")
+        return drawn
+
+    def update_effects(self, sim):
+        # Snow and penguins are just for show, so they live here rather than in
+        # the sim and headless runs don't pay for them. They still run on sim
+        # time, so they pause with the game and ignore the frame rate.
+        if self.penguin_count and self.penguin_terrain is not sim.terrain:
+            base = sim.terrain.rect
+            self.penguins = PenguinHuddle(self.penguin_count, base.left, base.right, base.top,
+                                          rng=np.random.default_rng(sim.seed))
+            self.penguin_terrain = sim.terrain
+            self.effects_tick = sim.ticks
+        ticks = sim.ticks - self.effects_tick
+        self.effects_tick = sim.ticks
+        if ticks <= 0:
+            return
+        dt = min(ticks * sim.timestep, MAX_FRAME_TIME)
+
+        if self.snow is not None:
+            self.snow.update(dt, sim.weather, self.snow_offset or (0, 0))
+        if self.penguins is not None:
+            # penguins scatter from whatever is about to land on them
+            penguins = self.penguins
+            pool = sim.hazard_manager.pool
+            overhead = pool.overlapping(pygame.Rect(penguins.left, penguins.ground_y - 300,
+                                                    penguins.right - penguins.left, 300))
+            hazard_xs = pool.x[overhead] + pool.w[overhead] / 2 if len(overhead) else ()
+            wind = sim.weather.wind_array(penguins.x, np.full(len(penguins.x), penguins.ground_y, np.float32),
+                                          smooth=False)
+            penguins.update(dt, wind, hazard_xs)
+
+    def draw_penguins(self, screen, penguins, camera_offset):
+        # back row first, facing the way they're waddling
+        sprite = assets.get("penguin")
+        if self.penguin_sprites is None or self.penguin_sprites[0] is not sprite:
+            self.penguin_sprites = (sprite, pygame.transform.flip(sprite, True, False))
+        right, left = self.penguin_sprites
+        order, xs, ys = penguins.screen_positions(camera_offset)
+        facing_left = (penguins.vx[order] < 0).tolist()
+        return screen.blits([(left if fl else right, (x, y))
+                             for fl, x, y in zip(facing_left, xs.tolist(), ys.tolist())])
+
+    def draw_snow(self, screen, camera_offset=(0, 0)):
+        if self.snow_offset is not None:
+            self.snow.scroll(camera_offset[0] - self.snow_offset[0], camera_offset[1] - self.snow_offset[1])
+        self.snow_offset = camera_offset
+        return self.snow.draw(screen)
+
+
+class DirtyRectRenderer(GameRenderer):
+    # For slow machines: the static layer is drawn once into its own surface,
+    # then each frame we only restore the areas entities covered last frame,
+    # draw the entities again and push just those rects to the display.
+    # Falls back to a full redraw when the camera scrolls or too much changed.
+
+    MAX_DIRTY_FRACTION = 0.5  # past this much of the screen a full flip is cheaper
+    ANIMATED_BACKGROUND = False  # drifting clouds would dirty everything
+
+    def __init__(self, snow=False):
+        # snow repaints the whole screen every frame, which defeats the point, so it's off by default
+        super().__init__(snow)
+        self.static_layer = None
+        self.prev_rects = []
+        self.camera_offset = None
+
+    def invalidate(self):
+        """Rebuild the static layer next frame (call when terrain changes)"""
+        self.static_layer = None
+
+    def draw(self, screen, sim, alpha=1.0, camera_offset=(0, 0)):
+        """Draw a frame, returns the list of changed rects or None for the whole screen"""
+        if self.sync_terrain(sim):
+            self.static_layer = None
+        camera_offset = world_offset(camera_offset)  # sub-pixel camera moves don't count
+        full_redraw = self.static_layer is None or camera_offset != self.camera_offset
+        if full_redraw:
+            if self.static_layer is None:
+                self.static_layer = new_surface(screen.get_size())
+            self.draw_static(self.static_layer, sim, camera_offset)
+        self.camera_offset = camera_offset
+
+        if full_redraw:
+            screen.blit(self.static_layer, (0, 0))
+            self.prev_rects = self.draw_dynamic(screen, sim, alpha, camera_offset)
+            return None
+
+        # wipe last frame's entities with the static layer underneath them
+        timer = self.timer
+        if timer:
+            timer.start()
+        for rect in self.prev_rects:
+            screen.blit(self.static_layer, rect, rect)
+        if timer:
+            timer.lap("restore")
+
+        drawn = self.draw_dynamic(screen, sim, alpha, camera_offset)
+        dirty = self.prev_rects + drawn
+        self.prev_rects = drawn
+
+        screen_area = screen.get_width() * screen.get_height()
+        if sum(r.w * r.h for r in dirty) > screen_area * self.MAX_DIRTY_FRACTION:
+            return None
+        return dirty
+
+
+class ScaledRenderer:
+    # Draws the world with another renderer into a fixed view_size
+    # framebuffer, then scales that to the window in one pass: nearest
+    # neighbour by the biggest whole factor that fits (letterboxed), or
+    # smoothscale to fill as much of the window as the aspect ratio allows.
+    # The frame is scaled straight into a subsurface of the window, kept
+    # until the window size changes, and the world is always drawn at
+    # view_size, so the fill rate doesn't grow with the monitor. The HUD goes
+    # on top at window resolution.
+
+    def __init__(self, renderer, view_size=(800, 600), smooth=False):
+        self.renderer = renderer
+        renderer.hud = None
+        self.view_size = view_size
+        self.smooth = smooth
+        self.frame = None
+        self.window_size = None
+        self.target = None  # the window area the frame is scaled into
+        self.nearest = True
+        self.hud = None
+
+    def invalidate(self):
+        """Lay out (and clear) the window again next frame"""
+        self.window_size = None
+
+    def layout(self, screen):
+        view_w, view_h = self.view_size
+        win_w, win_h = self.window_size = screen.get_size()
+        factor = min(win_w // view_w, win_h // view_h)
+        self.nearest = factor and not self.smooth
+        if not self.nearest:
+            factor = min(win_w / view_w, win_h / view_h)
+        size = (round(view_w * factor), round(view_h * factor))
+        dest = pygame.Rect(((win_w - size[0]) // 2, (win_h - size[1]) // 2), size)
+        screen.fill((0, 0, 0))
+        self.target = screen.subsurface(dest)
+        self.hud = Hud(scale=factor, origin=dest.topleft)
+        self.frame = new_surface(self.view_size)
+
+    def draw(self, screen, sim, alpha=1.0, camera_offset=(0, 0)):
+        """Draw a full frame. Returns None, meaning the whole screen changed"""
+        if screen.get_size() != self.window_size:
+            self.layout(screen)
+        self.renderer.draw(self.frame, sim, alpha, camera_offset)
+        timer = self.renderer.timer
+        if timer:
+            timer.start()
+
+        target = self.target
+        if target.get_size() == self.view_size:
+            target.blit(self.frame, (0, 0))
+        elif self.nearest:
+            pygame.transform.scale(self.frame, target.get_size(), target)
+        else:
+            pygame.transform.smoothscale(self.frame, target.get_size(), target)
+        if timer:
+            timer.lap("upscale")
+
+        self.hud.draw(screen, sim.player, sim.hazard_manager)
+        if timer:
+            timer.lap("hud")
+        return None
+
+
+# =========================
+# MAIN GAME LOOP
+# =========================
+
+
+def make_streamer(endless=False, seed=0, level_path=None, threaded=True):
+    # None means the single built-in section
+    if level_path:
+        return LevelFileStreamer(LevelFile(level_path))
+    return LevelStreamer(seed, threaded=threaded) if endless else None
+
+
+def main(dirty_rects=False, endless=False, seed=None, profile=False, trace_path=None, record_path=None,
+         tick_rate=60, level_path=None, scale=1, fullscreen=False, smooth=False):
+    pygame.init()
+    # the world is always 800x600, bigger windows get it scaled up in one pass
+    if fullscreen:
+        screen = pygame.display.set_mode((0, 0), pygame.FULLSCREEN)
+    elif scale != 1:
+        screen = pygame.display.set_mode((round(800 * scale), round(600 * scale)), pygame.RESIZABLE)
+    else:
+        screen = pygame.display.set_mode((800, 600))
+    pygame.display.set_caption("Arctic Platformer")
+    clock = pygame.time.Clock()
+
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    streamer = make_streamer(endless, seed, level_path)
+    sim = GameSimulation(1.0 / tick_rate, streamer=streamer, seed=seed)
+    recording = InputRecording.for_sim(sim) if record_path else None
+    # hold backspace to rewind, not while recording since the recording couldn't replay it
+    snapshots = SimSnapshots(sim) if recording is None else None
+    renderer = DirtyRectRenderer() if dirty_rects else GameRenderer()
+    scaler = None
+    if fullscreen or smooth or scale != 1:
+        scaler = ScaledRenderer(renderer, (800, 600), smooth)
+    camera = Camera((800, 600))
+    camera.snap(*sim.player.rect.center)
+
+    # F3 toggles the profiler overlay, nothing is timed until it's first needed
+    profiler = None
+    overlay = ProfilerOverlay()
+    show_overlay = profile
+    if profile or trace_path:
+        profiler = Profiler(trace=trace_path is not None)
+        profiler.attach(sim, renderer)
+
+    running = True
+    while running:
+        frame_time = clock.tick(60) / 1000.0  # seconds
+        frame = profiler.frame if profiler else None
+        if frame:
+            frame.start()
+
+        jump_pressed = False
+
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                running = False
+            elif event.type == pygame.KEYDOWN: 
+                if event.key == pygame.K_SPACE:
+                    jump_pressed = True
+                elif event.key == pygame.K_F3:
+                    show_overlay = not show_overlay
+                    if scaler is not None:
+                        scaler.invalidate()  # clear the overlay off the letterbox
+                    elif dirty_rects:
+                        renderer.invalidate()  # dirty rects alone would leave the overlay on screen
+                    if profiler is None:
+                        profiler = Profiler()
+                        profiler.attach(sim, renderer)
+
+        keys = pygame.key.get_pressed()
+        inputs = read_player_input(keys, jump_pressed)
+        rewinding = snapshots is not None and keys[pygame.K_BACKSPACE] and len(snapshots) > 1
+        if frame:
+            frame.lap("input")
+
+        # skip if game over/won, unless it's being rewound
+        if rewinding or not sim.finished:
+            if rewinding:
+                snapshots.rewind(max(1, round(frame_time / sim.timestep)))
+                alpha = 1.0
+            else:
+                alpha = sim.advance(frame_time, inputs)
+            if frame:
+                frame.lap("sim")
+
+            # Draw! This is not C so thankfully there should be no memory leaks here
+            camera.follow(*sim.player.rect.center, frame_time)
+            dirty = (scaler or renderer).draw(screen, sim, alpha, camera.offset)
+            if show_overlay:
+                overlay.draw(screen, profiler, sim, renderer)
+                dirty = None
+            if frame:
+                frame.lap("render")
+
+            if dirty is None:
+                pygame.display.flip()
+            else:
+                pygame.display.update(dirty)
+            if frame:
+                frame.lap("present")
+                profiler.end_frame()
+
+    if profiler is not None and trace_path:
+        profiler.export_chrome_trace(trace_path)
+    if recording is not None:
+        recording.finish(sim)
+        recording.save(record_path)
+    if streamer is not None:
+        streamer.close()
     pygame.quit()
 
 
+def main_headless(seconds, endless=False, seed=None, trace_path=None, tick_rate=60, level_path=None):
+    # e.g. python SnowMountainGame.py --headless 3600
+    streamer = make_streamer(endless, seed or 0, level_path, threaded=False)
+    sim = GameSimulation(1.0 / tick_rate, streamer=streamer, seed=seed or 0)
+    profiler = None
+    if trace_path:
+        profiler = Profiler(trace=True)
+        profiler.attach(sim)
+    start = time.perf_counter()
+    steps = run_headless(sim, seconds)
+    elapsed = time.perf_counter() - start
+    print(f"Simulated {steps * sim.timestep:.1f}s in {elapsed:.3f}s "
+          f"({steps / max(elapsed, 1e-9):.0f} steps/s), won={sim.game_won} over={sim.game_over}")
+    if profiler is not None:
+        profiler.export_chrome_trace(trace_path)
+    if streamer is not None:
+        streamer.close()
+
+
+def main_replay(path):
+    # e.g. python SnowMountainGame.py --replay run.smrp
+    recording = InputRecording.load(path)
+    start = time.perf_counter()
+    sim, mismatches = replay(recording)
+    elapsed = time.perf_counter() - start
+    print(f"Replayed {recording.ticks} ticks in {elapsed:.3f}s "
+          f"({recording.ticks / max(elapsed, 1e-9):.0f} ticks/s), won={sim.game_won} over={sim.game_over}")
+    if mismatches:
+        print(f"DESYNC at {len(mismatches)} of {len(recording.checkpoints)} checkpoints, first at tick {mismatches[0]}")
+        return 1
+    print(f"All {len(recording.checkpoints)} checkpoints match")
+    return 0
+
+
+def parse_args(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Arctic Platformer")
+    parser.add_argument("--headless", type=float, metavar="SECONDS",
+                        help="run this many simulated seconds with no window and exit")
+    parser.add_argument("--dirty-rects", action="store_true",
+                        help="only repaint what moved (for slow machines)")
+    parser.add_argument("--scale", type=float, default=1,
+                        help="window size as a multiple of 800x600, the world is drawn at 800x600 and scaled up")
+    parser.add_argument("--fullscreen", action="store_true", help="fullscreen, scaled up the same way")
+    parser.add_argument("--smooth", action="store_true",
+                        help="smoothscale to fill the window instead of whole-number pixel scaling")
+    parser.add_argument("--tick-rate", type=float, default=60, metavar="HZ",
+                        help="physics steps per second, 30 halves the CPU cost on weak machines")
+    parser.add_argument("--endless", action="store_true",
+                        help="endless streamed mountain instead of the single section")
+    parser.add_argument("--seed", type=int, help="seed for the level, hazards and weather")
+    parser.add_argument("--level", metavar="PATH", help="play a level file instead of a generated mountain")
+    parser.add_argument("--export-level", metavar="PATH",
+                        help="save --sections sections of the --seed mountain as a level file and exit")
+    parser.add_argument("--sections", type=int, default=100, help="how many sections --export-level saves")
+    parser.add_argument("--profile", action="store_true",
+                        help="start with the profiler overlay showing (F3 toggles it)")
+    parser.add_argument("--trace", metavar="PATH",
+                        help="record a Chrome trace-event JSON of every frame phase to PATH")
+    parser.add_argument("--record", metavar="PATH",
+                        help="record every tick's input to PATH so the run can be replayed")
+    parser.add_argument("--replay", metavar="PATH",
+                        help="re-run a recording headlessly and check it plays out the same")
+    args = parser.parse_args(argv)
+    if args.record and args.level:
+        parser.error("--record can't record level file runs yet")
+    return args
+
+
 if __name__ == "__main__":
-    main()
+    args = parse_args(sys.argv[1:])
+    if args.replay is not None:
+        sys.exit(main_replay(args.replay))
+    elif args.export_level is not None:
+        count = export_generated_level(args.export_level, args.seed or 0, args.sections)
+        print(f"Saved {count} platforms to {args.export_level}")
+    elif args.headless is not None:
+        main_headless(args.headless, endless=args.endless, seed=args.seed, trace_path=args.trace,
+                      tick_rate=args.tick_rate, level_path=args.level)
+    else:
+        main(dirty_rects=args.dirty_rects, endless=args.endless, seed=args.seed,
+             profile=args.profile, trace_path=args.trace, record_path=args.record, tick_rate=args.tick_rate,
+             level_path=args.level, scale=args.scale, fullscreen=args.fullscreen, smooth=args.smooth)
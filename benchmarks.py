@@ -0,0 +1,804 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # everything here runs headless
+
+import numpy as np
+import pygame
+
+from SnowMountainGame import (BASE_TERRAIN, LEVEL_PLATFORM, LEVEL_SURFACES, NO_INPUT, SECTION_RISE, SECTION_WIDTH,
+                              SPRITES, AssetManager, AvalancheFlow, Camera, ClimbEnv, DirtyRectRenderer,
+                              GameRenderer, GameSimulation, Hazard, HazardPool, JumpEnvelope, LapTimer, LevelFile,
+                              LevelFileStreamer, LevelStreamer, PenguinHuddle, Platform, PlayerInput,
+                              ScaledRenderer, SimSnapshots, SnowParticles, SpatialHash, TimerWheel, VecClimbEnv,
+                              WeatherSystem, WindField, export_generated_level, generate_mountain_section,
+                              load_sprite, unreachable_platforms)
+
+
+# =========================
+# HELPERS
+# =========================
+
+def time_per_call(fn, min_time=0.2, max_calls=100000):
+    # Run fn until min_time has passed, return seconds per call
+    calls = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < min_time and calls < max_calls:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - start
+    return elapsed / calls
+
+
+def time_once(fn):
+    start = time.perf_counter()
+    fn()
+    return time.perf_counter() - start
+
+
+def world_size(count, spacing=200):
+    # Square world that keeps density roughly the same for every count
+    side = int((count ** 0.5) * spacing) + 800
+    return side, side
+
+
+# =========================
+# BROADPHASE
+# =========================
+
+def bench_broadphase(counts=(10, 1000, 100000), seed=1):
+    """Linear colliderect scans vs SpatialHash queries for platforms and hazards"""
+    print(f"{'entities':>9} {'case':<22} {'linear us':>11} {'grid us':>11} {'speedup':>8}")
+    for count in counts:
+        rng = random.Random(seed)
+        width, height = world_size(count)
+
+        plats = [Platform(rng.randint(0, width), rng.randint(0, height),
+                          rng.randint(80, 200), rng.randint(15, 50), rng.choice(["ice", "rock"]))
+                 for _ in range(count)]
+        hazards = [Hazard(rng.randint(0, width), rng.randint(0, height), rng.choice(["icicle", "rock"]))
+                   for _ in range(count)]
+
+        platform_grid = SpatialHash()
+        for p in plats:
+            platform_grid.insert(p)
+        hazard_grid = SpatialHash()
+        for h in hazards:
+            hazard_grid.insert(h)
+
+        probes = [pygame.Rect(rng.randint(0, width), rng.randint(0, height), 32, 48) for _ in range(64)]
+        probe_iter = iter(range(10 ** 9))
+
+        def next_probe():
+            return probes[next(probe_iter) % len(probes)]
+
+        # platforms: static, one query per frame
+        def linear_platforms():
+            rect = next_probe()
+            return [p for p in plats if rect.colliderect(p.rect)]
+
+        def grid_platforms():
+            rect = next_probe()
+            return [p for p in platform_grid.query(rect) if rect.colliderect(p.rect)]
+
+        # hazards: every one falls a bit each frame, then one player query
+        def move_hazards():
+            for h in hazards:
+                h.rect.y += 6
+                if h.rect.top > height:
+                    h.rect.y = 0
+
+        def linear_hazards():
+            move_hazards()
+            rect = next_probe()
+            return [h for h in hazards if h.active and rect.colliderect(h.rect)]
+
+        def grid_hazards():
+            move_hazards()
+            for h in hazards:
+                hazard_grid.move(h)
+            rect = next_probe()
+            return [h for h in hazard_grid.query(rect) if h.active and rect.colliderect(h.rect)]
+
+        for case, linear, grid in (("platforms (static)", linear_platforms, grid_platforms),
+                                   ("hazards (move+query)", linear_hazards, grid_hazards)):
+            t_linear = time_per_call(linear) * 1e6
+            t_grid = time_per_call(grid) * 1e6
+            print(f"{count:>9} {case:<22} {t_linear:>11.2f} {t_grid:>11.2f} {t_linear / t_grid:>7.1f}x")
+
+
+# =========================
+# HAZARD STORAGE
+# =========================
+
+def bench_hazard_pool(counts=(1000, 10000, 100000), seed=1, dt=1 / 60):
+    """Old list-of-Hazard update/remove/collide vs the HazardPool arrays, during a storm"""
+    print(f"{'hazards':>9} {'list ms/frame':>14} {'pool ms/frame':>14} {'speedup':>8}")
+    player_rect = pygame.Rect(384, 520, 32, 48)
+    for count in counts:
+        rng = random.Random(seed)
+        spawns = [(rng.randint(0, 780), rng.randint(-50, 600), rng.choice(["icicle", "rock"]))
+                  for _ in range(count)]
+
+        hazards = [Hazard(x, y, kind) for x, y, kind in spawns]
+
+        def list_frame():
+            for hazard in hazards[:]:
+                hazard.update(dt)
+                if not hazard.active:
+                    hazards.remove(hazard)
+            for hazard in hazards:
+                if hazard.active and player_rect.colliderect(hazard.rect):
+                    hazard.active = False
+            # keep the storm going
+            while len(hazards) < count:
+                hazards.append(Hazard(rng.randint(0, 780), -50, "icicle"))
+
+        pool = HazardPool(count)
+        for x, y, kind in spawns:
+            pool.spawn(x, y, kind)
+
+        def pool_frame():
+            pool.update(dt)
+            for i in pool.overlapping(player_rect):
+                pool.despawn(i)
+            while pool.count < count:
+                pool.spawn(rng.randint(0, 780), -50, "icicle")
+
+        t_list = time_per_call(list_frame, max_calls=200) * 1e3
+        t_pool = time_per_call(pool_frame, max_calls=200) * 1e3
+        print(f"{count:>9} {t_list:>14.3f} {t_pool:>14.3f} {t_list / t_pool:>7.1f}x")
+
+
+def bench_collisions(counts=(100, 1000, 10000), seed=1, spread=60):
+    """Player vs hazards: box test only vs box test then sprite masks, hazards crowded around the player"""
+    print(f"{'hazards':>9} {'box hits':>9} {'pixel hits':>11} {'box us':>8} {'box+mask us':>12}")
+    sim = GameSimulation(seed=seed)
+    player = sim.player
+    manager = sim.hazard_manager
+    px, py = player.rect.topleft
+    for count in counts:
+        rng = random.Random(seed)
+        manager.pool.clear()
+        for _ in range(count):
+            manager.pool.spawn(px + rng.uniform(-spread, spread), py + rng.uniform(-spread, spread),
+                               rng.choice(["icicle", "rock"]), 0)
+        box = manager.pool.overlapping(player.rect)
+        pixel = manager.touching(player, box) if len(box) else []
+        t_box = time_per_call(lambda: manager.pool.overlapping(player.rect), max_calls=2000) * 1e6
+        t_mask = time_per_call(lambda: manager.touching(player, manager.pool.overlapping(player.rect)),
+                               max_calls=2000) * 1e6
+        print(f"{count:>9} {len(box):>9} {len(pixel):>11} {t_box:>8.1f} {t_mask:>12.1f}")
+
+
+def bench_avalanche(grids=((200, 150), (200, 200), (400, 300)), ticks=600, seed=1):
+    """AvalancheFlow step + draw while it pours over a generated section"""
+    pygame.init()
+    screen = pygame.display.get_surface() or pygame.display.set_mode((800, 600))
+    platforms = generate_mountain_section(["ice", "rock"], random.Random(seed)) + [Platform(0, 580, 300, 300, "rock")]
+    print(f"{'grid':>9} {'update ms':>10} {'max ms':>8} {'draw ms':>8}")
+    for cols, rows in grids:
+        flow = AvalancheFlow(0, -50, cols, rows)
+        flow.add_solids(platforms)
+        updates = []
+        for _ in range(ticks):
+            updates.append(time_once(flow.step))
+        flow.drawn_tick = None
+        t_draw = time_once(lambda: flow.draw(screen))
+        print(f"{cols:>4}x{rows:<4} {sum(updates) / ticks * 1e3:>10.3f} {max(updates) * 1e3:>8.3f} "
+              f"{t_draw * 1e3:>8.3f}")
+
+
+# =========================
+# STARTUP
+# =========================
+
+def bench_startup(runs=5):
+    """Module import time, and sprite loading on a first launch (empty disk cache) vs later launches"""
+    here = os.path.dirname(os.path.abspath(__file__))
+
+    # pygame and numpy are imported first so only the module's own cost is measured,
+    # and bytecode is allowed so later runs don't pay for compiling
+    code = ("import numpy, pygame, time; t = time.perf_counter(); import SnowMountainGame; "
+            "print(time.perf_counter() - t)")
+    env = {k: v for k, v in os.environ.items() if k != "PYTHONDONTWRITEBYTECODE"}
+    imports = [float(subprocess.run([sys.executable, "-c", code], cwd=here, env=env, capture_output=True,
+                                    text=True, check=True).stdout.split()[-1]) for _ in range(runs)]
+    print(f"import SnowMountainGame: {min(imports) * 1e3:.1f} ms")
+
+    pygame.init()
+    pygame.display.set_mode((800, 600))
+
+    def load_everything_old():
+        # what the module used to do at import, once per launch
+        for filename, size, _ in SPRITES.values():
+            load_sprite(os.path.join(here, filename), size)
+
+    def load_everything(cache_dir, threads):
+        manager = AssetManager(cache_dir=cache_dir)
+        if threads:
+            manager.preload()
+        for name in SPRITES:
+            manager.get(name)
+
+    def first_launch(cache_dir, threads):
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        return time_once(lambda: load_everything(cache_dir, threads))
+
+    cache_dir = tempfile.mkdtemp(prefix="asset_cache_")
+    try:
+        old = min(time_once(load_everything_old) for _ in range(runs))
+        cold = min(first_launch(cache_dir, False) for _ in range(runs))
+        cold_threaded = min(first_launch(cache_dir, True) for _ in range(runs))
+        warm = min(time_once(lambda: load_everything(cache_dir, False))
+                   for _ in range(runs))
+        warm_threaded = min(time_once(lambda: load_everything(cache_dir, True))
+                            for _ in range(runs))
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    print(f"load + scale + convert every launch:      {old * 1e3:.2f} ms")
+    print(f"AssetManager, first launch:               {cold * 1e3:.2f} ms")
+    print(f"AssetManager, first launch, preload():    {cold_threaded * 1e3:.2f} ms")
+    print(f"AssetManager, later launches:             {warm * 1e3:.2f} ms  ({old / warm:.1f}x)")
+    print(f"AssetManager, later launches, preload():  {warm_threaded * 1e3:.2f} ms")
+
+
+# =========================
+# UPSCALING
+# =========================
+
+def bench_upscale(windows=((800, 600), (1600, 1200), (2560, 1440), (3840, 2160)), frames=60):
+    """Whole frame at window resolution vs drawn at 800x600 and scaled up by ScaledRenderer"""
+    print(f"{'window':>10} {'native ms':>10} {'nearest ms':>11} {'smooth ms':>10}")
+    for size in windows:
+        screen = pygame.display.set_mode(size)
+        sim = GameSimulation(seed=1)
+        camera = Camera(size)
+        camera.snap(*sim.player.rect.center)
+        native = GameRenderer()
+        t_native = time_per_call(lambda: native.draw(screen, sim, 1.0, camera.offset), max_calls=frames)
+        times = []
+        for smooth in (False, True):
+            scaled = ScaledRenderer(GameRenderer(), (800, 600), smooth)
+            times.append(time_per_call(lambda: scaled.draw(screen, sim, 1.0, camera.offset), max_calls=frames))
+        print(f"{size[0]:>5}x{size[1]:<4} {t_native * 1e3:>10.2f} {times[0] * 1e3:>11.2f} {times[1] * 1e3:>10.2f}")
+    pygame.display.set_mode((800, 600))
+
+
+# =========================
+# SNOW
+# =========================
+
+def bench_snow(intensities=(0.5, 2, 5), dt=1 / 60):
+    """SnowParticles update + draw per frame at a few snow intensities, vs one blit per flake"""
+    pygame.init()
+    screen = pygame.display.get_surface() or pygame.display.set_mode((800, 600))
+    weather = WeatherSystem()
+    weather.wind_force = 40.0
+    print(f"{'flakes':>9} {'update ms':>10} {'draw ms':>10} {'blit/flake ms':>14}")
+    for intensity in intensities:
+        weather.snow_intensity = intensity
+        snow = SnowParticles(screen.get_size(), capacity=SnowParticles.FLAKES_PER_INTENSITY * max(intensities))
+        snow.update(dt, weather)
+        flake = pygame.Surface((2, 2))
+        flake.fill(SnowParticles.COLOR)
+
+        def blit_each():
+            # the obvious way, for comparison
+            for s in snow.spans():
+                for x, y in zip(snow.x[s].tolist(), snow.y[s].tolist()):
+                    screen.blit(flake, (x, y))
+
+        t_update = time_per_call(lambda: snow.update(dt, weather), max_calls=500) * 1e3
+        t_draw = time_per_call(lambda: snow.draw(screen), max_calls=500) * 1e3
+        t_blits = time_per_call(blit_each, max_calls=20) * 1e3
+        print(f"{snow.count:>9} {t_update:>10.3f} {t_draw:>10.3f} {t_blits:>14.3f}")
+
+
+# =========================
+# WIND
+# =========================
+
+def bench_wind(counts=(10, 1000, 24000, 60000), seed=1):
+    """Baking the WindField once, then reading it: one point, and arrays of points bilinear vs nearest"""
+    weather = WeatherSystem(random.Random(seed))
+    weather.wind_force = 40.0
+    t_bake = time_per_call(lambda: WindField(seed), max_calls=50) * 1e3
+    t_at = time_per_call(lambda: weather.wind_at(123.4, 456.7), max_calls=20000) * 1e6
+    print(f"bake {WindField.SIZE}x{WindField.SIZE}: {t_bake:.2f} ms, wind_at: {t_at:.2f} us")
+    print(f"{'points':>9} {'bilinear us':>12} {'nearest us':>11}")
+    rng = np.random.default_rng(seed)
+    for count in counts:
+        x = rng.uniform(0, 800, count).astype(np.float32)
+        y = rng.uniform(0, 600, count).astype(np.float32)
+        t_smooth = time_per_call(lambda: weather.wind_array(x, y), max_calls=500) * 1e6
+        t_nearest = time_per_call(lambda: weather.wind_array(x, y, smooth=False), max_calls=500) * 1e6
+        print(f"{count:>9} {t_smooth:>12.1f} {t_nearest:>11.1f}")
+
+
+# =========================
+# PENGUINS
+# =========================
+
+def bench_penguins(counts=(100, 1000, 10000), seed=1, dt=1 / 60, settle=120):
+    """PenguinHuddle update on the grid vs an all-pairs neighbour search, in wind with hazards falling"""
+    print(f"{'penguins':>9} {'pairs':>8} {'update ms':>10} {'all-pairs ms':>13}")
+    for count in counts:
+        # same spacing as the 12 on the base terrain
+        huddle = PenguinHuddle(count, 0, count * 25, 580, rng=np.random.default_rng(seed))
+        hazard_xs = np.random.default_rng(seed).uniform(0, count * 25, max(1, count // 100))
+        for _ in range(settle):  # let the huddles form first, that's when neighbours are densest
+            huddle.update(dt, 40.0)
+        pairs = int(huddle.neighbours.sum())
+
+        def all_pairs():
+            # just the neighbour search part, the way it'd be done without a grid
+            dx = huddle.x[:, None] - huddle.x[None, :]
+            dz = huddle.z[:, None] - huddle.z[None, :]
+            return np.nonzero(dx * dx + dz * dz < PenguinHuddle.RADIUS ** 2)
+
+        t_grid = time_per_call(lambda: huddle.update(dt, 40.0, hazard_xs), max_calls=500) * 1e3
+        t_all = f"{time_per_call(all_pairs, max_calls=50) * 1e3:>13.3f}" if count <= 2000 else f"{'-':>13}"
+        print(f"{count:>9} {pairs:>8} {t_grid:>10.3f} {t_all}")
+
+
+# =========================
+# SCHEDULER
+# =========================
+
+def bench_scheduler(counts=(100, 1000, 10000, 100000), seed=1, ticks=600):
+    """TimerWheel tick with N repeating emitters pending vs counting every one down each frame"""
+    print(f"{'timers':>9} {'fired/tick':>11} {'wheel us':>9} {'polling us':>11}")
+    for count in counts:
+        rng = random.Random(seed)
+        intervals = [rng.uniform(0.5, 10.0) for _ in range(count)]
+        fired = [0]
+
+        def fire():
+            fired[0] += 1
+
+        wheel = TimerWheel(1 / 60)
+        for interval in intervals:
+            wheel.every(interval, fire)
+        countdowns = list(intervals)
+
+        def poll(dt=1 / 60):
+            # the way HazardManager used to do its spawn timer, once per emitter
+            for i, left in enumerate(countdowns):
+                left -= dt
+                if left <= 0:
+                    left += intervals[i]
+                    fire()
+                countdowns[i] = left
+
+        t_wheel = time_per_call(wheel.advance, max_calls=ticks) * 1e6
+        per_tick = fired[0] / wheel.now
+        t_poll = time_per_call(poll, max_calls=ticks if count <= 10000 else 20) * 1e6
+        print(f"{count:>9} {per_tick:>11.1f} {t_wheel:>9.1f} {t_poll:>11.1f}")
+
+
+# =========================
+# TRAINING ENVIRONMENTS
+# =========================
+
+def bench_envs(num_envs=64, steps=100, seed=1):
+    """Env steps per second: one ClimbEnv, then VecClimbEnv in process and across every core"""
+    actions = np.random.default_rng(seed).integers(0, ClimbEnv.ACTIONS, (steps, num_envs), dtype=np.uint8)
+    cores = os.cpu_count() or 1
+    env = ClimbEnv(seed)
+    env.reset()
+
+    def step_one():
+        if env.step(int(actions[env.sim.ticks % steps, 0]))[2]:
+            env.reset()
+    single = 1 / time_per_call(step_one, max_calls=5000)
+    env.close()
+    vec = {}
+    for workers in sorted({0, cores}):
+        with VecClimbEnv(num_envs, workers=workers, seed=seed) as envs:
+            envs.reset()
+            vec[workers] = num_envs * steps / time_once(lambda: [envs.step(a) for a in actions])
+    print(f"ClimbEnv:                        {single:>9.0f} steps/s")
+    for workers, rate in vec.items():
+        print(f"VecClimbEnv({num_envs}), {workers:>2} worker(s): {rate:>9.0f} steps/s")
+
+
+# =========================
+# LEVEL FILES
+# =========================
+
+def bench_level_file(sections=10000, seed=42, visits=2000):
+    """Level file open + streaming vs building every section's Platforms up front"""
+    level_dir = tempfile.mkdtemp(prefix="level_")
+    path = os.path.join(level_dir, "big.smlv")
+    try:
+        count = export_generated_level(path, seed, sections)
+        print(f"{sections} sections, {count} platforms, {os.path.getsize(path) / 1024:.0f} KiB on disk")
+
+        def build_all():
+            streamer = LevelStreamer(seed, threaded=False)
+            return [p for i in range(sections) for p in streamer.build_section(i).platforms]
+
+        tracemalloc.start()
+        t_build = time_once(build_all)
+        build_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+        t_open = min(time_once(lambda: LevelFile(path).close()) for _ in range(5))
+        level = LevelFile(path)
+        streamer = LevelFileStreamer(level)
+        # walk up the mountain the way the player would, a cell at a time
+        keys = level.sections["key"].tolist()
+        step = max(1, len(keys) // visits)
+        cells = [(key >> 32, (key & 0xffffffff) - (1 << 31)) for key in keys[::step]]
+        tracemalloc.start()
+        start = time.perf_counter()
+        for sx, sy in cells:
+            streamer.update((sx + 0.5) * level.cell_w, (sy + 0.5) * level.cell_h)
+        t_walk = time.perf_counter() - start
+        stream_peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        streamer.close()
+    finally:
+        shutil.rmtree(level_dir, ignore_errors=True)
+
+    print(f"build every Platform:    {t_build * 1e3:9.2f} ms, peak {build_peak / 1024:8.0f} KiB")
+    print(f"open level file:         {t_open * 1e3:9.2f} ms")
+    print(f"stream {len(cells):>5} cells:       {t_walk / len(cells) * 1e3:9.3f} ms per cell, "
+          f"peak {stream_peak / 1024:8.0f} KiB")
+
+
+# =========================
+# LEVEL GENERATION
+# =========================
+
+def bench_generation(sections=2000, seed=1):
+    """Validated section generation and whole-level reachability checks, against the jump envelope's one-off cost"""
+    envelope = JumpEnvelope.default()
+    # what one trajectory simulation costs, the envelope does it once per set of physics values
+    t_envelope = time_once(lambda: JumpEnvelope(2000.0, -600, 1.4, 1400.0, 400, (0.0, 80.0)))
+    src, dst = pygame.Rect(0, 500, 100, 20), pygame.Rect(220, 440, 100, 20)
+    t_lookup = time_per_call(lambda: envelope.reaches(src, dst))
+    print(f"envelope (one jump stepped): {t_envelope * 1e6:8.1f} us, reaches() lookup {t_lookup * 1e6:.2f} us")
+
+    streamer = LevelStreamer(seed, threaded=False)
+    start = time.perf_counter()
+    built = [streamer.build_section(i) for i in range(sections)]
+    t_build = time.perf_counter() - start
+    platforms = [p for section in built for p in section.platforms]
+    start = time.perf_counter()
+    unreachable = unreachable_platforms(platforms, BASE_TERRAIN, envelope)
+    t_check = time.perf_counter() - start
+    print(f"generate + validate: {sections / t_build:8.0f} sections/s")
+    print(f"check whole level:   {len(platforms) / t_check:8.0f} platforms/s, {len(unreachable)} unreachable")
+
+
+# =========================
+# MEMORY
+# =========================
+
+class DictPlatform:
+    # Platform as it was before __slots__: a __dict__ plus slip and color per instance
+    def __init__(self, x, y, width, height, surface):
+        self.rect = pygame.Rect(x, y, width, height)
+        self.surface = surface
+        self.slip = 0.2 if surface == "ice" else 0.8
+        self.color = (100, 220, 255) if surface == "ice" else (100, 100, 100)
+
+
+class DictHazard:
+    # Hazard as it was before __slots__: its own damage, sprite, fall speed and Rect
+    def __init__(self, x, y, obst_type, sprite, rng):
+        self.obst_type = obst_type
+        self.damage = 10 if obst_type == "icicle" else 15
+        self.active = True
+        self.sprite = sprite
+        self.fallsp = rng.randint(300, 500)
+        self.rect = pygame.Rect(x, y, 20, 40) if obst_type == "icicle" else pygame.Rect(x, y, 30, 30)
+        self.prev_y = self.rect.y
+
+
+def traced_bytes(build):
+    # Bytes still allocated after build() returns, while its result is alive
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = build()
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del kept
+    return used
+
+
+def bench_memory(platforms=1000000, hazards=100000, seed=1):
+    """Bytes per entity for the dict, slotted and array layouts of platforms and hazards"""
+    rng = random.Random(seed)
+    plat_spawns = [(rng.randint(0, 100000), rng.randint(-10 ** 6, 0), rng.randint(80, 200),
+                    rng.randint(15, 50), rng.choice(["ice", "rock"])) for _ in range(platforms)]
+    hazard_spawns = [(rng.randint(0, 780), rng.randint(-50, 600), rng.choice(["icicle", "rock"]))
+                     for _ in range(hazards)]
+    sprite = pygame.Surface((20, 40))
+
+    def level_array():
+        plats = np.zeros(platforms, LEVEL_PLATFORM)
+        for i, name in enumerate(("x", "y", "w", "h")):
+            plats[name] = [spawn[i] for spawn in plat_spawns]
+        plats["surface"] = [LEVEL_SURFACES.index(spawn[4]) for spawn in plat_spawns]
+        return plats
+
+    def hazard_pool():
+        pool = HazardPool(hazards)
+        for x, y, kind in hazard_spawns:
+            pool.spawn(x, y, kind, rng=rng)
+        return pool
+
+    cases = (
+        (f"{platforms} platforms", platforms, (
+            ("dict Platform", lambda: [DictPlatform(*spawn) for spawn in plat_spawns]),
+            ("slotted Platform", lambda: [Platform(*spawn) for spawn in plat_spawns]),
+            ("level file records", level_array),
+        )),
+        (f"{hazards} hazards", hazards, (
+            ("dict Hazard", lambda: [DictHazard(x, y, kind, sprite, rng) for x, y, kind in hazard_spawns]),
+            ("slotted Hazard", lambda: [Hazard(x, y, kind, rng) for x, y, kind in hazard_spawns]),
+            ("HazardPool", hazard_pool),
+        )),
+    )
+    print(f"{'entities':<18} {'layout':<20} {'MiB':>8} {'bytes each':>11}")
+    for label, count, layouts in cases:
+        for name, build in layouts:
+            used = traced_bytes(build)
+            print(f"{label:<18} {name:<20} {used / 2 ** 20:>8.1f} {used / count:>11.1f}")
+
+
+# =========================
+# SNAPSHOTS
+# =========================
+
+def bench_snapshots(seconds=10.0, seed=1, hazards=200, backs=(1, 60, 600)):
+    """SimSnapshots capture per tick, restore from a few ticks to the whole buffer back, and its memory"""
+    sim = GameSimulation(seed=seed, verbose=False)
+    sim.player.health = sim.player.max_health = 10 ** 9
+    hm = sim.hazard_manager
+    hm.avalanche_timer = seconds - 2  # the last couple of seconds have the avalanche grid to snapshot too
+    for _ in range(hazards):
+        # high enough up that most are still falling at the end
+        hm.spawn_hazard(sim.player.position.x + hm.rng.randint(-400, 400), hm.rng.randint(-5000, -1000))
+
+    tracemalloc.start()
+    snapshots = SimSnapshots(sim, seconds)
+    ticks = round(seconds / sim.timestep)
+    for _ in range(ticks):
+        sim.step()
+    used = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    t_capture = time_per_call(snapshots.capture)
+    print(f"{len(snapshots)} ticks of {hm.pool.count} hazards + avalanche, {used / 2 ** 20:.1f} MiB, "
+          f"capture {t_capture * 1e6:.1f} us")
+    newest = snapshots.newest
+    for back in backs:
+        back = min(back, len(snapshots) - 1)
+        times = []
+        for _ in range(5):
+            times.append(time_once(lambda: snapshots.restore(newest - back)))
+            while sim.ticks < newest:  # play back up to where it was, so the same restore can run again
+                sim.step()
+        print(f"restore {back:>4} ticks back: {min(times) * 1e6:8.1f} us")
+
+
+# =========================
+# FRAME SCENARIOS
+# =========================
+# Each scenario sets up a fresh GameSimulation and returns a controller
+# (sim -> PlayerInput, or None for no input). If the game ends mid-run the
+# scenario is set up again and the run carries on.
+
+def scenario_idle(sim):
+    return None
+
+
+def scenario_storm(sim, hazards=1200):
+    # tough enough player to stand in a storm of 1k+ icicles and rocks
+    sim.player.health = sim.player.max_health = 10 ** 9
+
+    def controller(sim):
+        manager = sim.hazard_manager
+        while manager.pool.count < hazards:
+            manager.spawn_hazard(sim.player.position.x)
+        return NO_INPUT
+    return controller
+
+
+def scenario_long_level(sim, sections=200, seed=1):
+    rng = random.Random(seed)
+    sim.set_level([p for i in range(sections)
+                   for p in generate_mountain_section(sim.surfacelist, rng, (i * SECTION_WIDTH, i * SECTION_RISE))])
+
+    def controller(sim):
+        return PlayerInput(jump_pressed=sim.ticks % 45 == 0, jump_held=True, right=True)
+    return controller
+
+
+def scenario_avalanche(sim):
+    sim.hazard_manager.avalanche_timer = 0.0  # straight into the avalanche
+    return None
+
+
+FRAME_SCENARIOS = {
+    "idle": scenario_idle,
+    "storm": scenario_storm,
+    "long_level": scenario_long_level,
+    "avalanche": scenario_avalanche,
+}
+
+
+def percentiles(samples):
+    ms = np.asarray(samples) * 1e3
+    return {"p50": float(np.percentile(ms, 50)), "p95": float(np.percentile(ms, 95)),
+            "p99": float(np.percentile(ms, 99)), "mean": float(ms.mean())}
+
+
+def run_scenario(setup, frames, renderer_class=GameRenderer):
+    """Step + draw one frame at a time, returns {"update"|"draw": {phase: percentiles}} in ms"""
+    screen = pygame.display.get_surface() or pygame.display.set_mode((800, 600))
+    sim = GameSimulation()
+    renderer = renderer_class()
+    camera = Camera(screen.get_size())
+    sim.timer = LapTimer()
+    renderer.timer = LapTimer()
+    controller = setup(sim)
+    camera.snap(*sim.player.rect.center)
+
+    update_frames = []
+    draw_frames = []
+    for _ in range(frames):
+        if sim.finished:
+            sim.reset()
+            controller = setup(sim)
+            camera.snap(*sim.player.rect.center)
+        inputs = controller(sim) if controller else NO_INPUT
+
+        start = time.perf_counter()
+        sim.step(inputs)
+        middle = time.perf_counter()
+        camera.follow(*sim.player.rect.center, sim.timestep)
+        renderer.draw(screen, sim, 1.0, camera.offset)
+        end = time.perf_counter()
+
+        update = sim.timer.end_frame()
+        update["total"] = middle - start
+        update_frames.append(update)
+        draw = renderer.timer.end_frame()
+        draw["total"] = end - middle
+        draw_frames.append(draw)
+
+    result = {}
+    for side, recorded in (("update", update_frames), ("draw", draw_frames)):
+        phases = sorted({name for frame in recorded for name in frame})
+        result[side] = {name: percentiles([frame.get(name, 0.0) for frame in recorded]) for name in phases}
+    return result
+
+
+def compare_to_baseline(results, baseline, tolerance=0.25, noise_floor_ms=0.05):
+    """Print phases whose p95 got slower than the baseline, returns how many did"""
+    regressions = 0
+    for scenario, sides in results["scenarios"].items():
+        for side, phases in sides.items():
+            for phase, stats in phases.items():
+                old = baseline.get("scenarios", {}).get(scenario, {}).get(side, {}).get(phase)
+                if old is None:
+                    continue
+                new_p95 = stats["p95"]
+                old_p95 = old["p95"]
+                if new_p95 - old_p95 > noise_floor_ms and new_p95 > old_p95 * (1 + tolerance):
+                    regressions += 1
+                    print(f"REGRESSION {scenario}/{side}/{phase}: p95 {old_p95:.3f} -> {new_p95:.3f} ms")
+    return regressions
+
+
+def bench_frames(frames=600, scenarios=None, json_path=None, baseline_path=None, tolerance=0.25,
+                 dirty_rects=False):
+    """Per-frame update/draw percentiles per subsystem for each scripted scenario"""
+    pygame.init()
+    renderer_class = DirtyRectRenderer if dirty_rects else GameRenderer
+    results = {
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "machine": platform.machine(),
+        "frames": frames,
+        "renderer": renderer_class.__name__,
+        "scenarios": {},
+    }
+
+    for name in scenarios or FRAME_SCENARIOS:
+        stats = results["scenarios"][name] = run_scenario(FRAME_SCENARIOS[name], frames, renderer_class)
+        print(f"-- {name}")
+        print(f"   {'phase':<26} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for side, phases in stats.items():
+            for phase, p in phases.items():
+                print(f"   {side + '/' + phase:<26} {p['p50']:>8.3f} {p['p95']:>8.3f} {p['p99']:>8.3f}")
+
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"saved {json_path}")
+
+    if baseline_path:
+        with open(baseline_path) as f:
+            baseline = json.load(f)
+        regressions = compare_to_baseline(results, baseline, tolerance)
+        print(f"{regressions} regression(s) against {baseline_path}")
+        return regressions
+    return 0
+
+
+# =========================
+# ENTRY POINT
+# =========================
+
+BENCHMARKS = {
+    "broadphase": bench_broadphase,
+    "hazard_pool": bench_hazard_pool,
+    "collisions": bench_collisions,
+    "avalanche": bench_avalanche,
+    "startup": bench_startup,
+    "upscale": bench_upscale,
+    "snow": bench_snow,
+    "wind": bench_wind,
+    "penguins": bench_penguins,
+    "scheduler": bench_scheduler,
+    "envs": bench_envs,
+    "level_file": bench_level_file,
+    "generation": bench_generation,
+    "memory": bench_memory,
+    "snapshots": bench_snapshots,
+    "frames": bench_frames,
+}
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(description="SnowMountainGame benchmarks")
+    parser.add_argument("names", nargs="*", metavar="name",
+                        help=f"benchmarks to run: {', '.join(BENCHMARKS)} (default: all)")
+    frames = parser.add_argument_group("frames")
+    frames.add_argument("--frames", type=int, default=600, help="frames per scenario")
+    frames.add_argument("--scenario", action="append", choices=list(FRAME_SCENARIOS),
+                        help="only run these scenarios")
+    frames.add_argument("--dirty-rects", action="store_true", help="use DirtyRectRenderer")
+    frames.add_argument("--json", metavar="PATH", help="save results as JSON")
+    frames.add_argument("--baseline", metavar="PATH", help="compare against a saved JSON run")
+    frames.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed p95 slowdown against the baseline (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmark(s): {', '.join(unknown)}")
+    return args
+
+
+def main(argv):
+    args = parse_args(argv)
+    failed = 0
+    for name in args.names or BENCHMARKS:
+        print(f"== {name} ==")
+        if name == "frames":
+            failed += bench_frames(args.frames, args.scenario, args.json, args.baseline, args.tolerance,
+                                   args.dirty_rects)
+        else:
+            BENCHMARKS[name]()
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))